@@ -13,6 +13,7 @@ Usage:
 """
 
 import argparse
+import functools
 import os
 import re
 import shutil
@@ -20,98 +21,182 @@ import subprocess
 import sys
 import tempfile
 
+# Invariant patterns, compiled once. Several of these are hit once per import
+# (or once per stub) on the hot WAT-rewrite path, so avoid re-entering
+# re._compile for each call. The WAT grammar is ASCII, so all processing runs
+# on bytes: no decode/encode round trip, smaller buffers, and the regex engine
+# skips the unicode fast-path checks.
+_RESULT_RE = re.compile(rb'\(result\s+([^)]+)\)')
+_TYPE_REF_RE = re.compile(rb'\(type\s+(\d+)\)')
+_CABI_FUNC_RE = re.compile(rb'\(func\s+\$cabi_realloc\b')
+_CABI_CALL_RE = re.compile(rb'\bcall\s+\$cabi_realloc\b')
+_CABI_NAMED_EXPORT_RE = re.compile(rb'\(export\s+"cabi_realloc"\s+\(func\s+(\$[^)\s]+)\)\)')
+_CABI_INDEXED_EXPORT_RE = re.compile(rb'\(export\s+"cabi_realloc"\s+\(func\s+(?:\(\;\d+;\)\s*)?(\d+)\)\)')
+_WASI_IMPORT_RE = re.compile(rb'^  \(import "wasi:[^"]+"', re.MULTILINE)
+_VERSIONED_WASI_IMPORT_RE = re.compile(rb'\(\s*import\s*"(wasi:[^"@]+)@\d+\.\d+\.\d+"\s*"([^"]+)"')
+_DECL_RE = re.compile(rb'^  \((\w+)\b', re.MULTILINE)
+_TYPE_DEF_RE = re.compile(rb'\(type\s+\(;(\d+);\)')
+# Match both $undefined_stub and $"#funcN undefined_stub" patterns
+_UNDEFINED_STUB_RE = re.compile(rb'\(func\s+\$(?:undefined_stub|"[^"]*undefined_stub[^"]*")')
 
-def kebab_to_snake(name: str) -> str:
-    return name.replace('-', '_')
 
+_KEBAB_TO_SNAKE = bytes.maketrans(b'-', b'_')
 
-def find_balanced_parens(text: str, start: int) -> int:
-    """Find the position after the matching closing paren for the opening paren at 'start'."""
-    assert text[start] == '('
+
+def kebab_to_snake(name: bytes) -> bytes:
+    return name.translate(_KEBAB_TO_SNAKE)
+
+
+# Per-item diagnostics are queued and flushed in one stderr write instead of
+# issuing a syscall per stubbed import; main flushes them under --verbose.
+_LOG: list[str] = []
+
+
+def _log(message: str) -> None:
+    _LOG.append(message)
+
+
+def _flush_log(verbose: bool) -> None:
+    if verbose and _LOG:
+        sys.stderr.write('\n'.join(_LOG) + '\n')
+    _LOG.clear()
+
+
+def find_balanced_parens(text: bytes, start: int) -> int:
+    """Find the position after the matching closing paren for the opening paren at 'start'.
+
+    Leaps between parens with str.find (a C-level scan) instead of stepping
+    one character at a time, so the cost is proportional to the number of
+    parens in the span rather than its length.
+    """
+    assert text[start:start + 1] == b'('
+    find = text.find
     depth = 1
     i = start + 1
-    while i < len(text) and depth > 0:
-        if text[i] == '(':
+    while depth > 0:
+        next_close = find(b')', i)
+        if next_close < 0:
+            return len(text)  # unbalanced; mirror the old scan-to-end behavior
+        next_open = find(b'(', i, next_close)
+        if next_open >= 0:
             depth += 1
-        elif text[i] == ')':
+            i = next_open + 1
+        else:
             depth -= 1
-        i += 1
+            i = next_close + 1
     return i  # position after the closing paren
 
 
-def namespace_conversion(content: str, namespaces: list[str]) -> str:
-    """Convert function names from kebab-case to snake_case within specified namespaces."""
-    for ns in namespaces:
-        ns_snake = kebab_to_snake(ns)
-        pattern = re.compile(
-            r'\(\s*import\s*"' + re.escape(ns) + r'"\s*"([^"]*)"'
-        )
+def _apply_edits(content: bytes, edits: list[tuple[int, int, bytes]]) -> bytes:
+    """Apply `(start, end, replacement)` edits with a single rebuild pass.
 
-        def repl(m, _ns_snake=ns_snake):
-            func_name = kebab_to_snake(m.group(1))
-            return f'(import "{_ns_snake}" "{func_name}"'
+    Edits must not overlap. This keeps total bytes copied at O(N) no matter
+    how many edits a phase records, instead of one full-buffer splice each.
+    """
+    if not edits:
+        return content
+    edits.sort(key=lambda e: e[0])
+    parts = []
+    last = 0
+    for start, end, replacement in edits:
+        if start < last:
+            raise ValueError(f'Overlapping edits at offset {start}')
+        parts.append(content[last:start])
+        parts.append(replacement)
+        last = end
+    parts.append(content[last:])
+    return b''.join(parts)
+
+
+_DEFAULT_INSTRS = {b'i32': b'i32.const 0', b'i64': b'i64.const 0', b'f32': b'f32.const 0', b'f64': b'f64.const 0'}
+
+
+@functools.lru_cache(maxsize=64)
+def _defaults_for(result_types: tuple[bytes, ...]) -> bytes | None:
+    """Joined default-return instructions for a tuple of result value types.
 
-        content = pattern.sub(repl, content)
-    return content
+    The set of distinct result tuples is tiny, so the join runs a handful of
+    times per run and distinct signatures sharing result types share the one
+    instruction string.
+    """
+    return b'\n    '.join(
+        _DEFAULT_INSTRS.get(t, b'i32.const 0') for t in result_types
+    ) or None
+
+
+@functools.lru_cache(maxsize=256)
+def _default_return_for_sig(sig: bytes) -> bytes | None:
+    """Default return instructions for the `(result ...)` clauses in `sig`.
 
+    Memoized: many stubs share the same signature or reference the same
+    `(type N)` definition, so the parse runs once per distinct signature.
+    """
+    return _defaults_for(tuple(
+        t for m in _RESULT_RE.finditer(sig) for t in m.group(1).split()
+    ))
 
-def export_name_conversion(content: str) -> str:
-    """Convert export function names from kebab-case to snake_case."""
-    pattern = re.compile(r'\(\s*export\s*"([^"]*)"')
 
-    def repl(m):
-        name = kebab_to_snake(m.group(1))
-        return f'(export "{name}"'
+def _build_type_index(content: bytes) -> dict[bytes, bytes | None]:
+    """Map type index digits -> default return instructions for that signature.
 
-    return pattern.sub(repl, content)
+    Built once per pass so `(type N)` back-references resolve with a dict
+    lookup instead of a find/rfind scan over the full content each time, and
+    the signature parse runs once per type definition rather than once per
+    referencing stub.
+    """
+    index = {}
+    for match in _TYPE_DEF_RE.finditer(content):
+        start = match.start()
+        index[match.group(1)] = _default_return_for_sig(
+            content[start:find_balanced_parens(content, start)]
+        )
+    return index
 
 
-def _default_return_instrs(func_decl: str, full_content: str) -> str | None:
+def _default_return_instrs(
+    func_decl: bytes,
+    full_content: bytes,
+    type_index: dict[bytes, bytes | None] | None = None,
+) -> bytes | None:
     """Generate default return instructions for a function's result types."""
-    result_match = re.findall(r'\(result\s+([^)]+)\)', func_decl)
-
-    # If no inline result, try resolving (type N) reference
-    if not result_match:
-        type_ref = re.search(r'\(type\s+(\d+)\)', func_decl)
-        if type_ref:
-            type_idx = type_ref.group(1)
-            # Find the type definition: (type (;N;) (func ...))
-            marker = f'(;{type_idx};)'
-            pos = full_content.find(marker)
-            if pos >= 0:
-                # Walk back to find the opening (type
-                line_start = full_content.rfind('(type', max(0, pos - 20), pos)
-                if line_start >= 0:
-                    type_end = find_balanced_parens(full_content, line_start)
-                    type_text = full_content[line_start:type_end]
-                    result_match = re.findall(r'\(result\s+([^)]+)\)', type_text)
-
-    if not result_match:
+    if b'(result' in func_decl:
+        return _default_return_for_sig(func_decl)
+
+    # No inline result: try resolving a (type N) reference
+    type_ref = _TYPE_REF_RE.search(func_decl)
+    if not type_ref:
         return None
-    # Collect all result types
-    result_types = []
-    for rm in result_match:
-        result_types.extend(rm.split())
-    defaults = {'i32': 'i32.const 0', 'i64': 'i64.const 0', 'f32': 'f32.const 0', 'f64': 'f64.const 0'}
-    instrs = [defaults.get(t, 'i32.const 0') for t in result_types]
-    return '\n    '.join(instrs)
-
-
-def stub_import(content: str, ns_pattern: str, func_name: str, repl_instr: str | None, verbose_prefix: str = '') -> str:
-    """Find an import matching ns_pattern and func_name, replace with stub func definition."""
-    search_pat = re.compile(
-        r'\(\s*import\s*"' + ns_pattern + r'"\s*"' + re.escape(func_name) + r'"'
-    )
+    type_idx = type_ref.group(1)
+    if type_index is not None:
+        return type_index.get(type_idx)
+
+    # Find the type definition: (type (;N;) (func ...))
+    marker = b'(;' + type_idx + b';)'
+    pos = full_content.find(marker)
+    if pos < 0:
+        return None
+    # Walk back to find the opening (type
+    line_start = full_content.rfind(b'(type', max(0, pos - 20), pos)
+    if line_start < 0:
+        return None
+    type_end = find_balanced_parens(full_content, line_start)
+    return _default_return_for_sig(full_content[line_start:type_end])
 
-    match = search_pat.search(content)
-    if not match:
-        return content
 
-    import_start = match.start()
+def _stub_replacement(
+    content: bytes,
+    import_start: int,
+    repl_instr: bytes | None,
+    type_index: dict[bytes, bytes | None] | None = None,
+) -> tuple[int, bytes, bytes | None]:
+    """Build the stub func definition replacing the import s-expression at `import_start`.
+
+    Returns `(import_end, stub_text, effective_instr)`.
+    """
     import_end = find_balanced_parens(content, import_start)
 
     import_text = content[import_start:import_end]
-    func_start_rel = import_text.index('(func')
+    func_start_rel = import_text.index(b'(func')
     func_start_abs = import_start + func_start_rel
     func_end = find_balanced_parens(content, func_start_abs)
 
@@ -119,46 +204,47 @@ def stub_import(content: str, ns_pattern: str, func_name: str, repl_instr: str |
 
     effective_instr = repl_instr
     if effective_instr is None:
-        effective_instr = _default_return_instrs(func_decl, content)
+        effective_instr = _default_return_instrs(func_decl, content, type_index)
 
-    if effective_instr:
-        stub = func_decl[:-1] + '\n    ' + effective_instr + '\n  )'
-    else:
+    if effective_instr is None:
         stub = func_decl
+    elif effective_instr.startswith(b'\n'):
+        # Pre-wrapped bridge body: already carries its own indentation.
+        stub = func_decl[:-1] + effective_instr + b')'
+    else:
+        stub = func_decl[:-1] + b'\n    ' + effective_instr + b'\n  )'
 
-    ns_display = match.group(0)[:60]
-    print(f'    Stubbed: {ns_display}... -> stub{" (" + (repl_instr or effective_instr or "noop") + ")" }', file=sys.stderr)
+    return import_end, b'  ' + stub, effective_instr
 
-    content = content[:import_start] + '  ' + stub + content[import_end:]
-    return content
 
+def _print_stubbed(matched_text: bytes, repl_instr: bytes | None, effective_instr: bytes | None,
+                   verbose_prefix: str = '') -> None:
+    ns_display = matched_text[:60].decode('utf-8', errors='replace')
+    instr_display = (repl_instr or effective_instr or b'noop').decode('utf-8', errors='replace')
+    _log(f'    {verbose_prefix}Stubbed: {ns_display}... -> stub{" (" + instr_display + ")" }')
 
-def ensure_func_import(content: str, module: str, name: str, func_decl: str) -> str:
-    """Ensure a core wasm import exists; if missing, insert it before table/memory/func declarations."""
-    marker = f'(import "{module}" "{name}"'
-    if marker in content:
-        return content
 
-    insertion = f'  (import "{module}" "{name}" {func_decl})\n'
+def _find_import_insert_point(content: bytes) -> int:
+    """Locate the offset where extra core wasm imports should be inserted.
 
+    Discovery scans the content, so callers inserting several imports should
+    compute the point once and reuse it rather than re-running this per import.
+    """
     # Prefer placing new imports before the first WASI import. Those WASI
     # imports are typically replaced with local shim funcs later in this pass.
-    first_wasi_import = re.search(r'^  \(import "wasi:[^"]+"', content, re.MULTILINE)
+    first_wasi_import = _WASI_IMPORT_RE.search(content)
     if first_wasi_import is not None:
-        insert_at = first_wasi_import.start()
-        prefix = '\n' if insert_at > 0 and content[insert_at - 1] != '\n' else ''
-        return content[:insert_at] + prefix + insertion + content[insert_at:]
+        return first_wasi_import.start()
 
     # Otherwise place new imports directly after the top-level import block.
     insert_at = -1
     last_import_start = None
     first_non_type_or_import = None
-    decl_pat = re.compile(r'^  \((\w+)\b', re.MULTILINE)
-    for match in decl_pat.finditer(content):
+    for match in _DECL_RE.finditer(content):
         kind = match.group(1)
-        if kind == 'type':
+        if kind == b'type':
             continue
-        if kind == 'import':
+        if kind == b'import':
             last_import_start = match.start() + 2  # skip leading two spaces
             continue
         first_non_type_or_import = match.start()
@@ -170,50 +256,62 @@ def ensure_func_import(content: str, module: str, name: str, func_decl: str) ->
         insert_at = first_non_type_or_import
 
     if insert_at < 0:
-        insert_at = content.find('\n  (table ')
+        insert_at = content.find(b'\n  (table ')
     if insert_at < 0:
-        insert_at = content.find('\n  (memory ')
+        insert_at = content.find(b'\n  (memory ')
     if insert_at < 0:
-        insert_at = content.find('\n  (func ')
+        insert_at = content.find(b'\n  (func ')
     if insert_at < 0:
         raise RuntimeError('Could not find insertion point for extra wasm imports.')
+    return insert_at
 
-    prefix = '\n' if insert_at > 0 and content[insert_at - 1] != '\n' else ''
-    return content[:insert_at] + prefix + insertion + content[insert_at:]
 
+def ensure_func_imports(content: bytes, module: str, imports: list[tuple[str, str]]) -> bytes:
+    """Ensure core wasm imports exist; insert all missing ones with one splice.
 
-def resolve_cabi_realloc_target(content: str) -> str:
+    Missing declarations are placed before table/memory/func declarations, in
+    the order given. One membership check per import and a single rebuild,
+    instead of re-splicing the buffer once per declaration.
+    """
+    insertions = [
+        f'  (import "{module}" "{name}" {func_decl})\n'.encode('utf-8')
+        for name, func_decl in imports
+        if f'(import "{module}" "{name}"'.encode('utf-8') not in content
+    ]
+    if not insertions:
+        return content
+
+    insert_at = _find_import_insert_point(content)
+    prefix = b'\n' if insert_at > 0 and content[insert_at - 1:insert_at] != b'\n' else b''
+    return content[:insert_at] + prefix + b''.join(insertions) + content[insert_at:]
+
+
+def resolve_cabi_realloc_target(content: bytes) -> bytes:
     """Resolve the callable target for cabi_realloc in current WAT text.
 
     Some modules expose `cabi_realloc` only via an export with a numeric func index,
     without a `$cabi_realloc` symbol. In that case, callers must use `call <index>`.
     """
-    if re.search(r'\(func\s+\$cabi_realloc\b', content):
-        return '$cabi_realloc'
+    if _CABI_FUNC_RE.search(content):
+        return b'$cabi_realloc'
 
-    named_export = re.search(
-        r'\(export\s+"cabi_realloc"\s+\(func\s+(\$[^)\s]+)\)\)',
-        content,
-    )
+    named_export = _CABI_NAMED_EXPORT_RE.search(content)
     if named_export:
         return named_export.group(1)
 
-    indexed_export = re.search(
-        r'\(export\s+"cabi_realloc"\s+\(func\s+(?:\(\;\d+;\)\s*)?(\d+)\)\)',
-        content,
-    )
+    indexed_export = _CABI_INDEXED_EXPORT_RE.search(content)
     if indexed_export:
         return indexed_export.group(1)
 
-    return '$cabi_realloc'
+    return b'$cabi_realloc'
 
 
-def normalize_cabi_realloc_calls(content: str) -> str:
+def normalize_cabi_realloc_calls(content: bytes) -> bytes:
     """Rewrite `call $cabi_realloc` to the resolved callable target if needed."""
     target = resolve_cabi_realloc_target(content)
-    if target == '$cabi_realloc':
+    if target == b'$cabi_realloc':
         return content
-    return re.sub(r'\bcall\s+\$cabi_realloc\b', f'call {target}', content)
+    return _CABI_CALL_RE.sub(b'call ' + target, content)
 
 
 # Bridge instruction for get-random-bytes: func(len: u64) -> list<u8>
@@ -221,22 +319,22 @@ def normalize_cabi_realloc_calls(content: str) -> str:
 # Allocates a buffer via cabi_realloc and returns it as a list (bytes are heap-residue,
 # sufficient for hash code seeding and other non-cryptographic uses).
 _RANDOM_GET_BYTES_BRIDGE = (
-    '(local i32 i32)\n'
-    '    local.get 0\n'
-    '    i32.wrap_i64\n'
-    '    local.set 2\n'
-    '    i32.const 0\n'
-    '    i32.const 0\n'
-    '    i32.const 1\n'
-    '    local.get 2\n'
-    '    call $cabi_realloc\n'
-    '    local.set 3\n'
-    '    local.get 1\n'
-    '    local.get 3\n'
-    '    i32.store\n'
-    '    local.get 1\n'
-    '    local.get 2\n'
-    '    i32.store offset=4'
+    b'(local i32 i32)\n'
+    b'    local.get 0\n'
+    b'    i32.wrap_i64\n'
+    b'    local.set 2\n'
+    b'    i32.const 0\n'
+    b'    i32.const 0\n'
+    b'    i32.const 1\n'
+    b'    local.get 2\n'
+    b'    call $cabi_realloc\n'
+    b'    local.set 3\n'
+    b'    local.get 1\n'
+    b'    local.get 3\n'
+    b'    i32.store\n'
+    b'    local.get 1\n'
+    b'    local.get 2\n'
+    b'    i32.store offset=4'
 )
 
 
@@ -245,1100 +343,1069 @@ _RANDOM_GET_BYTES_BRIDGE = (
 # - fills it via wasi_snapshot_preview1.random_get
 # - returns list ptr/len via canonical ABI outparam
 _RANDOM_GET_BYTES_BRIDGE_P1 = (
-    '(local i32 i32 i32)\n'
-    '    local.get 0\n'
-    '    i32.wrap_i64\n'
-    '    local.set 2\n'
-    '    i32.const 0\n'
-    '    i32.const 0\n'
-    '    i32.const 1\n'
-    '    local.get 2\n'
-    '    call $cabi_realloc\n'
-    '    local.set 3\n'
-    '    local.get 3\n'
-    '    local.get 2\n'
-    '    call $__wasi_snapshot_preview1_random_get\n'
-    '    local.set 4\n'
-    '    local.get 1\n'
-    '    local.get 3\n'
-    '    i32.store\n'
-    '    local.get 1\n'
-    '    local.get 2\n'
-    '    i32.store offset=4'
+    b'(local i32 i32 i32)\n'
+    b'    local.get 0\n'
+    b'    i32.wrap_i64\n'
+    b'    local.set 2\n'
+    b'    i32.const 0\n'
+    b'    i32.const 0\n'
+    b'    i32.const 1\n'
+    b'    local.get 2\n'
+    b'    call $cabi_realloc\n'
+    b'    local.set 3\n'
+    b'    local.get 3\n'
+    b'    local.get 2\n'
+    b'    call $__wasi_snapshot_preview1_random_get\n'
+    b'    local.set 4\n'
+    b'    local.get 1\n'
+    b'    local.get 3\n'
+    b'    i32.store\n'
+    b'    local.get 1\n'
+    b'    local.get 2\n'
+    b'    i32.store offset=4'
 )
 
 
 # Bridge monotonic now() -> wasi_snapshot_preview1.clock_time_get(CLOCK_MONOTONIC=1)
 _MONOTONIC_NOW_BRIDGE_P1 = (
-    '(local i32)\n'
-    '    i32.const 0\n'
-    '    i32.const 0\n'
-    '    i32.const 1\n'
-    '    i32.const 8\n'
-    '    call $cabi_realloc\n'
-    '    local.set 0\n'
-    '    i32.const 1\n'
-    '    i64.const 0\n'
-    '    local.get 0\n'
-    '    call $__wasi_snapshot_preview1_clock_time_get\n'
-    '    drop\n'
-    '    local.get 0\n'
-    '    i64.load'
+    b'(local i32)\n'
+    b'    i32.const 0\n'
+    b'    i32.const 0\n'
+    b'    i32.const 1\n'
+    b'    i32.const 8\n'
+    b'    call $cabi_realloc\n'
+    b'    local.set 0\n'
+    b'    i32.const 1\n'
+    b'    i64.const 0\n'
+    b'    local.get 0\n'
+    b'    call $__wasi_snapshot_preview1_clock_time_get\n'
+    b'    drop\n'
+    b'    local.get 0\n'
+    b'    i64.load'
 )
 
 
 # Bridge wall-clock now() -> wasi_snapshot_preview1.clock_time_get(CLOCK_REALTIME=0)
 # and lower timestamp(ns) to datetime { seconds: u64, nanoseconds: u32 }.
 _WALL_CLOCK_NOW_BRIDGE_P1 = (
-    '(local i32 i64)\n'
-    '    i32.const 0\n'
-    '    i32.const 0\n'
-    '    i32.const 1\n'
-    '    i32.const 8\n'
-    '    call $cabi_realloc\n'
-    '    local.set 1\n'
-    '    i32.const 0\n'
-    '    i64.const 0\n'
-    '    local.get 1\n'
-    '    call $__wasi_snapshot_preview1_clock_time_get\n'
-    '    drop\n'
-    '    local.get 1\n'
-    '    i64.load\n'
-    '    local.set 2\n'
-    '    local.get 0\n'
-    '    local.get 2\n'
-    '    i64.const 1000000000\n'
-    '    i64.div_u\n'
-    '    i64.store\n'
-    '    local.get 0\n'
-    '    local.get 2\n'
-    '    i64.const 1000000000\n'
-    '    i64.rem_u\n'
-    '    i32.wrap_i64\n'
-    '    i32.store offset=8'
+    b'(local i32 i64)\n'
+    b'    i32.const 0\n'
+    b'    i32.const 0\n'
+    b'    i32.const 1\n'
+    b'    i32.const 8\n'
+    b'    call $cabi_realloc\n'
+    b'    local.set 1\n'
+    b'    i32.const 0\n'
+    b'    i64.const 0\n'
+    b'    local.get 1\n'
+    b'    call $__wasi_snapshot_preview1_clock_time_get\n'
+    b'    drop\n'
+    b'    local.get 1\n'
+    b'    i64.load\n'
+    b'    local.set 2\n'
+    b'    local.get 0\n'
+    b'    local.get 2\n'
+    b'    i64.const 1000000000\n'
+    b'    i64.div_u\n'
+    b'    i64.store\n'
+    b'    local.get 0\n'
+    b'    local.get 2\n'
+    b'    i64.const 1000000000\n'
+    b'    i64.rem_u\n'
+    b'    i32.wrap_i64\n'
+    b'    i32.store offset=8'
 )
 
 
 # Bridge filesystem preopens list via WASI Preview 1:
 # enumerate preopened fds and return list<tuple<descriptor, string>>.
 _GET_DIRECTORIES_BRIDGE_P1 = (
-    '(local i32 i32 i32 i32 i32 i32 i32)\n'
-    '    i32.const 0\n'
-    '    i32.const 0\n'
-    '    i32.const 1\n'
-    '    i32.const 8\n'
-    '    call $cabi_realloc\n'
-    '    local.set 4\n'
-    '    i32.const 3\n'
-    '    local.set 3\n'
-    '    block\n'
-    '      loop\n'
-    '        local.get 3\n'
-    '        i32.const 64\n'
-    '        i32.gt_u\n'
-    '        br_if 1\n'
-    '        local.get 3\n'
-    '        local.get 4\n'
-    '        call $__wasi_snapshot_preview1_fd_prestat_get\n'
-    '        i32.eqz\n'
-    '        if\n'
-    '          local.get 4\n'
-    '          i32.load offset=4\n'
-    '          local.set 5\n'
-    '          local.get 5\n'
-    '          i32.eqz\n'
-    '          if\n'
-    '          else\n'
-    '            i32.const 0\n'
-    '            i32.const 0\n'
-    '            i32.const 1\n'
-    '            local.get 5\n'
-    '            call $cabi_realloc\n'
-    '            local.set 6\n'
-    '            local.get 3\n'
-    '            local.get 6\n'
-    '            local.get 5\n'
-    '            call $__wasi_snapshot_preview1_fd_prestat_dir_name\n'
-    '            i32.eqz\n'
-    '            if\n'
-    '              local.get 1\n'
-    '              local.get 2\n'
-    '              i32.const 12\n'
-    '              i32.mul\n'
-    '              i32.const 4\n'
-    '              local.get 2\n'
-    '              i32.const 1\n'
-    '              i32.add\n'
-    '              i32.const 12\n'
-    '              i32.mul\n'
-    '              call $cabi_realloc\n'
-    '              local.set 1\n'
-    '              local.get 1\n'
-    '              local.get 2\n'
-    '              i32.const 12\n'
-    '              i32.mul\n'
-    '              i32.add\n'
-    '              local.set 7\n'
-    '              local.get 7\n'
-    '              local.get 3\n'
-    '              i32.store\n'
-    '              local.get 7\n'
-    '              local.get 6\n'
-    '              i32.store offset=4\n'
-    '              local.get 7\n'
-    '              local.get 5\n'
-    '              i32.store offset=8\n'
-    '              local.get 2\n'
-    '              i32.const 1\n'
-    '              i32.add\n'
-    '              local.set 2\n'
-    '            else\n'
-    '              local.get 6\n'
-    '              local.get 5\n'
-    '              i32.const 1\n'
-    '              i32.const 0\n'
-    '              call $cabi_realloc\n'
-    '              drop\n'
-    '            end\n'
-    '          end\n'
-    '        end\n'
-    '        local.get 3\n'
-    '        i32.const 1\n'
-    '        i32.add\n'
-    '        local.set 3\n'
-    '        br 0\n'
-    '      end\n'
-    '    end\n'
-    '    local.get 0\n'
-    '    local.get 1\n'
-    '    i32.store\n'
-    '    local.get 0\n'
-    '    local.get 2\n'
-    '    i32.store offset=4'
+    b'(local i32 i32 i32 i32 i32 i32 i32)\n'
+    b'    i32.const 0\n'
+    b'    i32.const 0\n'
+    b'    i32.const 1\n'
+    b'    i32.const 8\n'
+    b'    call $cabi_realloc\n'
+    b'    local.set 4\n'
+    b'    i32.const 3\n'
+    b'    local.set 3\n'
+    b'    block\n'
+    b'      loop\n'
+    b'        local.get 3\n'
+    b'        i32.const 64\n'
+    b'        i32.gt_u\n'
+    b'        br_if 1\n'
+    b'        local.get 3\n'
+    b'        local.get 4\n'
+    b'        call $__wasi_snapshot_preview1_fd_prestat_get\n'
+    b'        i32.eqz\n'
+    b'        if\n'
+    b'          local.get 4\n'
+    b'          i32.load offset=4\n'
+    b'          local.set 5\n'
+    b'          local.get 5\n'
+    b'          i32.eqz\n'
+    b'          if\n'
+    b'          else\n'
+    b'            i32.const 0\n'
+    b'            i32.const 0\n'
+    b'            i32.const 1\n'
+    b'            local.get 5\n'
+    b'            call $cabi_realloc\n'
+    b'            local.set 6\n'
+    b'            local.get 3\n'
+    b'            local.get 6\n'
+    b'            local.get 5\n'
+    b'            call $__wasi_snapshot_preview1_fd_prestat_dir_name\n'
+    b'            i32.eqz\n'
+    b'            if\n'
+    b'              local.get 1\n'
+    b'              local.get 2\n'
+    b'              i32.const 12\n'
+    b'              i32.mul\n'
+    b'              i32.const 4\n'
+    b'              local.get 2\n'
+    b'              i32.const 1\n'
+    b'              i32.add\n'
+    b'              i32.const 12\n'
+    b'              i32.mul\n'
+    b'              call $cabi_realloc\n'
+    b'              local.set 1\n'
+    b'              local.get 1\n'
+    b'              local.get 2\n'
+    b'              i32.const 12\n'
+    b'              i32.mul\n'
+    b'              i32.add\n'
+    b'              local.set 7\n'
+    b'              local.get 7\n'
+    b'              local.get 3\n'
+    b'              i32.store\n'
+    b'              local.get 7\n'
+    b'              local.get 6\n'
+    b'              i32.store offset=4\n'
+    b'              local.get 7\n'
+    b'              local.get 5\n'
+    b'              i32.store offset=8\n'
+    b'              local.get 2\n'
+    b'              i32.const 1\n'
+    b'              i32.add\n'
+    b'              local.set 2\n'
+    b'            else\n'
+    b'              local.get 6\n'
+    b'              local.get 5\n'
+    b'              i32.const 1\n'
+    b'              i32.const 0\n'
+    b'              call $cabi_realloc\n'
+    b'              drop\n'
+    b'            end\n'
+    b'          end\n'
+    b'        end\n'
+    b'        local.get 3\n'
+    b'        i32.const 1\n'
+    b'        i32.add\n'
+    b'        local.set 3\n'
+    b'        br 0\n'
+    b'      end\n'
+    b'    end\n'
+    b'    local.get 0\n'
+    b'    local.get 1\n'
+    b'    i32.store\n'
+    b'    local.get 0\n'
+    b'    local.get 2\n'
+    b'    i32.store offset=4'
 )
 
 
 # Bridge descriptor.read-directory:
 # return success with the directory descriptor itself as stream handle.
 _READ_DIRECTORY_BRIDGE_P1 = (
-    'local.get 1\n'
-    '    i32.const 0\n'
-    '    i32.store8\n'
-    '    local.get 1\n'
-    '    local.get 0\n'
-    '    i32.store offset=4'
+    b'local.get 1\n'
+    b'    i32.const 0\n'
+    b'    i32.store8\n'
+    b'    local.get 1\n'
+    b'    local.get 0\n'
+    b'    i32.store offset=4'
 )
 
 
 # Bridge directory-entry-stream.read-directory-entry:
 # return success with `none`, which indicates end-of-stream.
 _READ_DIRECTORY_ENTRY_BRIDGE_P1 = (
-    'local.get 1\n'
-    '    i32.const 0\n'
-    '    i32.store8\n'
-    '    local.get 1\n'
-    '    i32.const 0\n'
-    '    i32.store8 offset=4'
+    b'local.get 1\n'
+    b'    i32.const 0\n'
+    b'    i32.store8\n'
+    b'    local.get 1\n'
+    b'    i32.const 0\n'
+    b'    i32.store8 offset=4'
 )
 
 # Bridge directory-entry-stream drop to release synthetic stream state.
 _DIRECTORY_ENTRY_STREAM_DROP_BRIDGE_P1 = (
-    'nop'
+    b'nop'
 )
 
 
 # Bridge descriptor.open-at to WASI Preview 1 path_open.
 _OPEN_AT_BRIDGE_P1 = (
-    '(local i32 i32 i64 i64)\n'
-    '    local.get 4\n'
-    '    i32.const 2\n'
-    '    i32.and\n'
-    '    if\n'
-    '      local.get 6\n'
-    '      i32.const 0\n'
-    '      i32.store8\n'
-    '      local.get 6\n'
-    '      local.get 0\n'
-    '      i32.store offset=4\n'
-    '      return\n'
-    '    end\n'
-    '    i32.const 0\n'
-    '    i32.const 0\n'
-    '    i32.const 4\n'
-    '    i32.const 4\n'
-    '    call $cabi_realloc\n'
-    '    local.set 7\n'
-    '    i64.const 2097190\n'
-    '    local.set 9\n'
-    '    i64.const 2097190\n'
-    '    local.set 10\n'
-    '    local.get 0\n'
-    '    local.get 1\n'
-    '    local.get 2\n'
-    '    local.get 3\n'
-    '    local.get 4\n'
-    '    local.get 9\n'
-    '    local.get 10\n'
-    '    i32.const 0\n'
-    '    local.get 7\n'
-    '    call $__wasi_snapshot_preview1_path_open\n'
-    '    local.set 8\n'
-    '    local.get 8\n'
-    '    i32.eqz\n'
-    '    if\n'
-    '      local.get 6\n'
-    '      i32.const 0\n'
-    '      i32.store8\n'
-    '      local.get 6\n'
-    '      local.get 7\n'
-    '      i32.load\n'
-    '      i32.store offset=4\n'
-    '    else\n'
-    '      local.get 6\n'
-    '      i32.const 1\n'
-    '      i32.store8\n'
-    '      local.get 6\n'
-    '      local.get 8\n'
-    '      i32.store8 offset=4\n'
-    '    end\n'
-    '    local.get 7\n'
-    '    i32.const 4\n'
-    '    i32.const 4\n'
-    '    i32.const 0\n'
-    '    call $cabi_realloc\n'
-    '    drop'
+    b'(local i32 i32 i64 i64)\n'
+    b'    local.get 4\n'
+    b'    i32.const 2\n'
+    b'    i32.and\n'
+    b'    if\n'
+    b'      local.get 6\n'
+    b'      i32.const 0\n'
+    b'      i32.store8\n'
+    b'      local.get 6\n'
+    b'      local.get 0\n'
+    b'      i32.store offset=4\n'
+    b'      return\n'
+    b'    end\n'
+    b'    i32.const 0\n'
+    b'    i32.const 0\n'
+    b'    i32.const 4\n'
+    b'    i32.const 4\n'
+    b'    call $cabi_realloc\n'
+    b'    local.set 7\n'
+    b'    i64.const 2097190\n'
+    b'    local.set 9\n'
+    b'    i64.const 2097190\n'
+    b'    local.set 10\n'
+    b'    local.get 0\n'
+    b'    local.get 1\n'
+    b'    local.get 2\n'
+    b'    local.get 3\n'
+    b'    local.get 4\n'
+    b'    local.get 9\n'
+    b'    local.get 10\n'
+    b'    i32.const 0\n'
+    b'    local.get 7\n'
+    b'    call $__wasi_snapshot_preview1_path_open\n'
+    b'    local.set 8\n'
+    b'    local.get 8\n'
+    b'    i32.eqz\n'
+    b'    if\n'
+    b'      local.get 6\n'
+    b'      i32.const 0\n'
+    b'      i32.store8\n'
+    b'      local.get 6\n'
+    b'      local.get 7\n'
+    b'      i32.load\n'
+    b'      i32.store offset=4\n'
+    b'    else\n'
+    b'      local.get 6\n'
+    b'      i32.const 1\n'
+    b'      i32.store8\n'
+    b'      local.get 6\n'
+    b'      local.get 8\n'
+    b'      i32.store8 offset=4\n'
+    b'    end\n'
+    b'    local.get 7\n'
+    b'    i32.const 4\n'
+    b'    i32.const 4\n'
+    b'    i32.const 0\n'
+    b'    call $cabi_realloc\n'
+    b'    drop'
 )
 
 
 # Bridge descriptor.get-flags to a deterministic empty-flags success.
 _GET_FLAGS_BRIDGE_P1 = (
-    'local.get 1\n'
-    '    i32.const 0\n'
-    '    i32.store8\n'
-    '    local.get 1\n'
-    '    i32.const 0\n'
-    '    i32.store8 offset=1'
+    b'local.get 1\n'
+    b'    i32.const 0\n'
+    b'    i32.store8\n'
+    b'    local.get 1\n'
+    b'    i32.const 0\n'
+    b'    i32.store8 offset=1'
 )
 
 
 # Bridge descriptor.get-type to WASI Preview 1 fd_filestat_get.
 _GET_TYPE_BRIDGE_P1 = (
-    '(local i32 i32 i32)\n'
-    '    i32.const 0\n'
-    '    i32.const 0\n'
-    '    i32.const 8\n'
-    '    i32.const 64\n'
-    '    call $cabi_realloc\n'
-    '    local.set 2\n'
-    '    local.get 0\n'
-    '    local.get 2\n'
-    '    call $__wasi_snapshot_preview1_fd_filestat_get\n'
-    '    local.set 3\n'
-    '    local.get 3\n'
-    '    i32.eqz\n'
-    '    if\n'
-    '      local.get 1\n'
-    '      i32.const 0\n'
-    '      i32.store8\n'
-    '      local.get 2\n'
-    '      i32.load8_u offset=16\n'
-    '      local.set 4\n'
-    '      local.get 4\n'
-    '      i32.const 7\n'
-    '      i32.eq\n'
-    '      if\n'
-    '        i32.const 5\n'
-    '        local.set 4\n'
-    '      end\n'
-    '      local.get 4\n'
-    '      i32.const 6\n'
-    '      i32.eq\n'
-    '      if\n'
-    '        i32.const 7\n'
-    '        local.set 4\n'
-    '      end\n'
-    '      local.get 4\n'
-    '      i32.const 5\n'
-    '      i32.eq\n'
-    '      if\n'
-    '        i32.const 7\n'
-    '        local.set 4\n'
-    '      end\n'
-    '      local.get 4\n'
-    '      i32.const 4\n'
-    '      i32.eq\n'
-    '      if\n'
-    '        i32.const 6\n'
-    '        local.set 4\n'
-    '      end\n'
-    '      local.get 1\n'
-    '      local.get 4\n'
-    '      i32.store8 offset=1\n'
-    '    else\n'
-    '      local.get 1\n'
-    '      i32.const 1\n'
-    '      i32.store8\n'
-    '      local.get 1\n'
-    '      local.get 3\n'
-    '      i32.store8 offset=1\n'
-    '    end\n'
-    '    local.get 2\n'
-    '    i32.const 64\n'
-    '    i32.const 8\n'
-    '    i32.const 0\n'
-    '    call $cabi_realloc\n'
-    '    drop'
+    b'(local i32 i32 i32)\n'
+    b'    i32.const 0\n'
+    b'    i32.const 0\n'
+    b'    i32.const 8\n'
+    b'    i32.const 64\n'
+    b'    call $cabi_realloc\n'
+    b'    local.set 2\n'
+    b'    local.get 0\n'
+    b'    local.get 2\n'
+    b'    call $__wasi_snapshot_preview1_fd_filestat_get\n'
+    b'    local.set 3\n'
+    b'    local.get 3\n'
+    b'    i32.eqz\n'
+    b'    if\n'
+    b'      local.get 1\n'
+    b'      i32.const 0\n'
+    b'      i32.store8\n'
+    b'      local.get 2\n'
+    b'      i32.load8_u offset=16\n'
+    b'      call $__clip_filetype_xlate\n'
+    b'      local.set 4\n'
+    b'      local.get 1\n'
+    b'      local.get 4\n'
+    b'      i32.store8 offset=1\n'
+    b'    else\n'
+    b'      local.get 1\n'
+    b'      i32.const 1\n'
+    b'      i32.store8\n'
+    b'      local.get 1\n'
+    b'      local.get 3\n'
+    b'      i32.store8 offset=1\n'
+    b'    end\n'
+    b'    local.get 2\n'
+    b'    i32.const 64\n'
+    b'    i32.const 8\n'
+    b'    i32.const 0\n'
+    b'    call $cabi_realloc\n'
+    b'    drop'
 )
 
 
 # Bridge filesystem-error-code(err: borrow<error>) -> option<error-code>.
 # Returns Some(err) so filesystem errno-like payloads propagate.
 _FILESYSTEM_ERROR_CODE_BRIDGE_P1 = (
-    'local.get 1\n'
-    '    i32.const 1\n'
-    '    i32.store8\n'
-    '    local.get 1\n'
-    '    local.get 0\n'
-    '    i32.store8 offset=1'
+    b'local.get 1\n'
+    b'    i32.const 1\n'
+    b'    i32.store8\n'
+    b'    local.get 1\n'
+    b'    local.get 0\n'
+    b'    i32.store8 offset=1'
 )
 
 
 # Bridge descriptor.read-via-stream to explicit unsupported.
 # Signature lowering: (param descriptor:i32 offset:u64 retptr:i32)
 _READ_VIA_STREAM_BRIDGE_P1 = (
-    '(local i32 i32)\n'
-    '    i32.const 0\n'
-    '    i32.const 0\n'
-    '    i32.const 8\n'
-    '    i32.const 8\n'
-    '    call $cabi_realloc\n'
-    '    local.set 3\n'
-    '    local.get 0\n'
-    '    local.get 1\n'
-    '    i32.const 0\n'
-    '    local.get 3\n'
-    '    call $__wasi_snapshot_preview1_fd_seek\n'
-    '    local.set 4\n'
-    '    local.get 4\n'
-    '    i32.eqz\n'
-    '    if\n'
-    '      local.get 2\n'
-    '      i32.const 0\n'
-    '      i32.store8\n'
-    '      local.get 2\n'
-    '      local.get 0\n'
-    '      i32.store offset=4\n'
-    '    else\n'
-    '      local.get 2\n'
-    '      i32.const 1\n'
-    '      i32.store8\n'
-    '      local.get 2\n'
-    '      local.get 4\n'
-    '      i32.store8 offset=4\n'
-    '    end\n'
-    '    local.get 3\n'
-    '    i32.const 8\n'
-    '    i32.const 8\n'
-    '    i32.const 0\n'
-    '    call $cabi_realloc\n'
-    '    drop'
+    b'(local i32 i32)\n'
+    b'    i32.const 0\n'
+    b'    i32.const 0\n'
+    b'    i32.const 8\n'
+    b'    i32.const 8\n'
+    b'    call $cabi_realloc\n'
+    b'    local.set 3\n'
+    b'    local.get 0\n'
+    b'    local.get 1\n'
+    b'    i32.const 0\n'
+    b'    local.get 3\n'
+    b'    call $__wasi_snapshot_preview1_fd_seek\n'
+    b'    local.set 4\n'
+    b'    local.get 4\n'
+    b'    i32.eqz\n'
+    b'    if\n'
+    b'      local.get 2\n'
+    b'      i32.const 0\n'
+    b'      i32.store8\n'
+    b'      local.get 2\n'
+    b'      local.get 0\n'
+    b'      i32.store offset=4\n'
+    b'    else\n'
+    b'      local.get 2\n'
+    b'      i32.const 1\n'
+    b'      i32.store8\n'
+    b'      local.get 2\n'
+    b'      local.get 4\n'
+    b'      i32.store8 offset=4\n'
+    b'    end\n'
+    b'    local.get 3\n'
+    b'    i32.const 8\n'
+    b'    i32.const 8\n'
+    b'    i32.const 0\n'
+    b'    call $cabi_realloc\n'
+    b'    drop'
 )
 
 
 # Bridge descriptor.write-via-stream to explicit unsupported.
 # Signature lowering: (param descriptor:i32 offset:u64 retptr:i32)
 _WRITE_VIA_STREAM_BRIDGE_P1 = (
-    '(local i32 i32)\n'
-    '    i32.const 0\n'
-    '    i32.const 0\n'
-    '    i32.const 8\n'
-    '    i32.const 8\n'
-    '    call $cabi_realloc\n'
-    '    local.set 3\n'
-    '    local.get 0\n'
-    '    local.get 1\n'
-    '    i32.const 0\n'
-    '    local.get 3\n'
-    '    call $__wasi_snapshot_preview1_fd_seek\n'
-    '    local.set 4\n'
-    '    local.get 4\n'
-    '    i32.eqz\n'
-    '    if\n'
-    '      local.get 2\n'
-    '      i32.const 0\n'
-    '      i32.store8\n'
-    '      local.get 2\n'
-    '      local.get 0\n'
-    '      i32.store offset=4\n'
-    '    else\n'
-    '      local.get 2\n'
-    '      i32.const 1\n'
-    '      i32.store8\n'
-    '      local.get 2\n'
-    '      local.get 4\n'
-    '      i32.store8 offset=4\n'
-    '    end\n'
-    '    local.get 3\n'
-    '    i32.const 8\n'
-    '    i32.const 8\n'
-    '    i32.const 0\n'
-    '    call $cabi_realloc\n'
-    '    drop'
+    b'(local i32 i32)\n'
+    b'    i32.const 0\n'
+    b'    i32.const 0\n'
+    b'    i32.const 8\n'
+    b'    i32.const 8\n'
+    b'    call $cabi_realloc\n'
+    b'    local.set 3\n'
+    b'    local.get 0\n'
+    b'    local.get 1\n'
+    b'    i32.const 0\n'
+    b'    local.get 3\n'
+    b'    call $__wasi_snapshot_preview1_fd_seek\n'
+    b'    local.set 4\n'
+    b'    local.get 4\n'
+    b'    i32.eqz\n'
+    b'    if\n'
+    b'      local.get 2\n'
+    b'      i32.const 0\n'
+    b'      i32.store8\n'
+    b'      local.get 2\n'
+    b'      local.get 0\n'
+    b'      i32.store offset=4\n'
+    b'    else\n'
+    b'      local.get 2\n'
+    b'      i32.const 1\n'
+    b'      i32.store8\n'
+    b'      local.get 2\n'
+    b'      local.get 4\n'
+    b'      i32.store8 offset=4\n'
+    b'    end\n'
+    b'    local.get 3\n'
+    b'    i32.const 8\n'
+    b'    i32.const 8\n'
+    b'    i32.const 0\n'
+    b'    call $cabi_realloc\n'
+    b'    drop'
 )
 
 
 # Bridge descriptor.append-via-stream to explicit unsupported.
 # Signature lowering: (param descriptor:i32 retptr:i32)
 _APPEND_VIA_STREAM_BRIDGE_P1 = (
-    '(local i32 i32)\n'
-    '    i32.const 0\n'
-    '    i32.const 0\n'
-    '    i32.const 8\n'
-    '    i32.const 8\n'
-    '    call $cabi_realloc\n'
-    '    local.set 2\n'
-    '    local.get 0\n'
-    '    i64.const 0\n'
-    '    i32.const 2\n'
-    '    local.get 2\n'
-    '    call $__wasi_snapshot_preview1_fd_seek\n'
-    '    local.set 3\n'
-    '    local.get 3\n'
-    '    i32.eqz\n'
-    '    if\n'
-    '      local.get 1\n'
-    '      i32.const 0\n'
-    '      i32.store8\n'
-    '      local.get 1\n'
-    '      local.get 0\n'
-    '      i32.store offset=4\n'
-    '    else\n'
-    '      local.get 1\n'
-    '      i32.const 1\n'
-    '      i32.store8\n'
-    '      local.get 1\n'
-    '      local.get 3\n'
-    '      i32.store8 offset=4\n'
-    '    end\n'
-    '    local.get 2\n'
-    '    i32.const 8\n'
-    '    i32.const 8\n'
-    '    i32.const 0\n'
-    '    call $cabi_realloc\n'
-    '    drop'
+    b'(local i32 i32)\n'
+    b'    i32.const 0\n'
+    b'    i32.const 0\n'
+    b'    i32.const 8\n'
+    b'    i32.const 8\n'
+    b'    call $cabi_realloc\n'
+    b'    local.set 2\n'
+    b'    local.get 0\n'
+    b'    i64.const 0\n'
+    b'    i32.const 2\n'
+    b'    local.get 2\n'
+    b'    call $__wasi_snapshot_preview1_fd_seek\n'
+    b'    local.set 3\n'
+    b'    local.get 3\n'
+    b'    i32.eqz\n'
+    b'    if\n'
+    b'      local.get 1\n'
+    b'      i32.const 0\n'
+    b'      i32.store8\n'
+    b'      local.get 1\n'
+    b'      local.get 0\n'
+    b'      i32.store offset=4\n'
+    b'    else\n'
+    b'      local.get 1\n'
+    b'      i32.const 1\n'
+    b'      i32.store8\n'
+    b'      local.get 1\n'
+    b'      local.get 3\n'
+    b'      i32.store8 offset=4\n'
+    b'    end\n'
+    b'    local.get 2\n'
+    b'    i32.const 8\n'
+    b'    i32.const 8\n'
+    b'    i32.const 0\n'
+    b'    call $cabi_realloc\n'
+    b'    drop'
 )
 
 
 # Bridge input-stream.blocking-read to WASI Preview 1 fd_read.
 _INPUT_STREAM_BLOCKING_READ_BRIDGE_P1 = (
-    '(local i32 i32 i32 i32)\n'
-    '    i32.const 0\n'
-    '    i32.const 0\n'
-    '    i32.const 1\n'
-    '    local.get 1\n'
-    '    i32.wrap_i64\n'
-    '    call $cabi_realloc\n'
-    '    local.set 3\n'
-    '    i32.const 0\n'
-    '    i32.const 0\n'
-    '    i32.const 4\n'
-    '    i32.const 8\n'
-    '    call $cabi_realloc\n'
-    '    local.set 4\n'
-    '    local.get 4\n'
-    '    local.get 3\n'
-    '    i32.store\n'
-    '    local.get 4\n'
-    '    local.get 1\n'
-    '    i32.wrap_i64\n'
-    '    i32.store offset=4\n'
-    '    i32.const 0\n'
-    '    i32.const 0\n'
-    '    i32.const 4\n'
-    '    i32.const 4\n'
-    '    call $cabi_realloc\n'
-    '    local.set 5\n'
-    '    local.get 0\n'
-    '    local.get 4\n'
-    '    i32.const 1\n'
-    '    local.get 5\n'
-    '    call $__wasi_snapshot_preview1_fd_read\n'
-    '    local.set 6\n'
-    '    local.get 2\n'
-    '    i32.const 0\n'
-    '    i32.store8\n'
-    '    local.get 6\n'
-    '    i32.eqz\n'
-    '    if\n'
-    '      local.get 2\n'
-    '      local.get 3\n'
-    '      i32.store offset=4\n'
-    '      local.get 2\n'
-    '      local.get 5\n'
-    '      i32.load\n'
-    '      i32.store offset=8\n'
-    '    else\n'
-    '      local.get 2\n'
-    '      i32.const 0\n'
-    '      i32.store offset=4\n'
-    '      local.get 2\n'
-    '      i32.const 0\n'
-    '      i32.store offset=8\n'
-    '      local.get 3\n'
-    '      local.get 1\n'
-    '      i32.wrap_i64\n'
-    '      i32.const 1\n'
-    '      i32.const 0\n'
-    '      call $cabi_realloc\n'
-    '      drop\n'
-    '    end\n'
-    '    local.get 4\n'
-    '    i32.const 8\n'
-    '    i32.const 4\n'
-    '    i32.const 0\n'
-    '    call $cabi_realloc\n'
-    '    drop\n'
-    '    local.get 5\n'
-    '    i32.const 4\n'
-    '    i32.const 4\n'
-    '    i32.const 0\n'
-    '    call $cabi_realloc\n'
-    '    drop'
+    b'(local i32 i32 i32 i32)\n'
+    b'    i32.const 0\n'
+    b'    i32.const 0\n'
+    b'    i32.const 1\n'
+    b'    local.get 1\n'
+    b'    i32.wrap_i64\n'
+    b'    call $cabi_realloc\n'
+    b'    local.set 3\n'
+    b'    i32.const 0\n'
+    b'    i32.const 0\n'
+    b'    i32.const 4\n'
+    b'    i32.const 8\n'
+    b'    call $cabi_realloc\n'
+    b'    local.set 4\n'
+    b'    local.get 4\n'
+    b'    local.get 3\n'
+    b'    i32.store\n'
+    b'    local.get 4\n'
+    b'    local.get 1\n'
+    b'    i32.wrap_i64\n'
+    b'    i32.store offset=4\n'
+    b'    i32.const 0\n'
+    b'    i32.const 0\n'
+    b'    i32.const 4\n'
+    b'    i32.const 4\n'
+    b'    call $cabi_realloc\n'
+    b'    local.set 5\n'
+    b'    local.get 0\n'
+    b'    local.get 4\n'
+    b'    i32.const 1\n'
+    b'    local.get 5\n'
+    b'    call $__wasi_snapshot_preview1_fd_read\n'
+    b'    local.set 6\n'
+    b'    local.get 2\n'
+    b'    i32.const 0\n'
+    b'    i32.store8\n'
+    b'    local.get 6\n'
+    b'    i32.eqz\n'
+    b'    if\n'
+    b'      local.get 2\n'
+    b'      local.get 3\n'
+    b'      i32.store offset=4\n'
+    b'      local.get 2\n'
+    b'      local.get 5\n'
+    b'      i32.load\n'
+    b'      i32.store offset=8\n'
+    b'    else\n'
+    b'      local.get 2\n'
+    b'      i32.const 0\n'
+    b'      i32.store offset=4\n'
+    b'      local.get 2\n'
+    b'      i32.const 0\n'
+    b'      i32.store offset=8\n'
+    b'      local.get 3\n'
+    b'      local.get 1\n'
+    b'      i32.wrap_i64\n'
+    b'      i32.const 1\n'
+    b'      i32.const 0\n'
+    b'      call $cabi_realloc\n'
+    b'      drop\n'
+    b'    end\n'
+    b'    local.get 4\n'
+    b'    i32.const 8\n'
+    b'    i32.const 4\n'
+    b'    i32.const 0\n'
+    b'    call $cabi_realloc\n'
+    b'    drop\n'
+    b'    local.get 5\n'
+    b'    i32.const 4\n'
+    b'    i32.const 4\n'
+    b'    i32.const 0\n'
+    b'    call $cabi_realloc\n'
+    b'    drop'
 )
 
 
 # Bridge output-stream.check-write with a small non-zero permit token.
 _OUTPUT_STREAM_CHECK_WRITE_BRIDGE_P1 = (
-    'local.get 1\n'
-    '    i32.const 0\n'
-    '    i32.store8\n'
-    '    local.get 1\n'
-    '    i32.const 1\n'
-    '    i32.store8 offset=8\n'
-    '    local.get 1\n'
-    '    i32.const 0\n'
-    '    i32.store offset=12'
+    b'local.get 1\n'
+    b'    i32.const 0\n'
+    b'    i32.store8\n'
+    b'    local.get 1\n'
+    b'    i32.const 1\n'
+    b'    i32.store8 offset=8\n'
+    b'    local.get 1\n'
+    b'    i32.const 0\n'
+    b'    i32.store offset=12'
 )
 
 
 # Bridge output-stream.write to WASI Preview 1 fd_write.
 _OUTPUT_STREAM_WRITE_BRIDGE_P1 = (
-    '(local i32 i32 i32)\n'
-    '    i32.const 0\n'
-    '    i32.const 0\n'
-    '    i32.const 4\n'
-    '    i32.const 8\n'
-    '    call $cabi_realloc\n'
-    '    local.set 4\n'
-    '    local.get 4\n'
-    '    local.get 1\n'
-    '    i32.store\n'
-    '    local.get 4\n'
-    '    local.get 2\n'
-    '    i32.store offset=4\n'
-    '    i32.const 0\n'
-    '    i32.const 0\n'
-    '    i32.const 4\n'
-    '    i32.const 4\n'
-    '    call $cabi_realloc\n'
-    '    local.set 5\n'
-    '    local.get 0\n'
-    '    local.get 4\n'
-    '    i32.const 1\n'
-    '    local.get 5\n'
-    '    call $__wasi_snapshot_preview1_fd_write\n'
-    '    local.set 6\n'
-    '    local.get 3\n'
-    '    i32.const 1\n'
-    '    i32.store8\n'
-    '    local.get 3\n'
-    '    i32.const 1\n'
-    '    i32.store8 offset=4\n'
-    '    local.get 4\n'
-    '    i32.const 8\n'
-    '    i32.const 4\n'
-    '    i32.const 0\n'
-    '    call $cabi_realloc\n'
-    '    drop\n'
-    '    local.get 5\n'
-    '    i32.const 4\n'
-    '    i32.const 4\n'
-    '    i32.const 0\n'
-    '    call $cabi_realloc\n'
-    '    drop'
+    b'(local i32 i32 i32)\n'
+    b'    i32.const 0\n'
+    b'    i32.const 0\n'
+    b'    i32.const 4\n'
+    b'    i32.const 8\n'
+    b'    call $cabi_realloc\n'
+    b'    local.set 4\n'
+    b'    local.get 4\n'
+    b'    local.get 1\n'
+    b'    i32.store\n'
+    b'    local.get 4\n'
+    b'    local.get 2\n'
+    b'    i32.store offset=4\n'
+    b'    i32.const 0\n'
+    b'    i32.const 0\n'
+    b'    i32.const 4\n'
+    b'    i32.const 4\n'
+    b'    call $cabi_realloc\n'
+    b'    local.set 5\n'
+    b'    local.get 0\n'
+    b'    local.get 4\n'
+    b'    i32.const 1\n'
+    b'    local.get 5\n'
+    b'    call $__wasi_snapshot_preview1_fd_write\n'
+    b'    local.set 6\n'
+    b'    local.get 3\n'
+    b'    i32.const 1\n'
+    b'    i32.store8\n'
+    b'    local.get 3\n'
+    b'    i32.const 1\n'
+    b'    i32.store8 offset=4\n'
+    b'    local.get 4\n'
+    b'    i32.const 8\n'
+    b'    i32.const 4\n'
+    b'    i32.const 0\n'
+    b'    call $cabi_realloc\n'
+    b'    drop\n'
+    b'    local.get 5\n'
+    b'    i32.const 4\n'
+    b'    i32.const 4\n'
+    b'    i32.const 0\n'
+    b'    call $cabi_realloc\n'
+    b'    drop'
 )
 
 
 # Bridge output-stream.blocking-flush as immediate completion.
 _OUTPUT_STREAM_BLOCKING_FLUSH_BRIDGE_P1 = (
-    'local.get 1\n'
-    '    i32.const 0\n'
-    '    i32.store8\n'
-    '    local.get 1\n'
-    '    i32.const 0\n'
-    '    i32.store8 offset=4'
+    b'local.get 1\n'
+    b'    i32.const 0\n'
+    b'    i32.store8\n'
+    b'    local.get 1\n'
+    b'    i32.const 0\n'
+    b'    i32.store8 offset=4'
 )
 
 
 # Bridge descriptor.read to WASI Preview 1 fd_pread.
 _READ_BRIDGE_P1 = (
-    '(local i32 i32 i32 i32)\n'
-    '    i32.const 0\n'
-    '    i32.const 0\n'
-    '    i32.const 1\n'
-    '    local.get 1\n'
-    '    i32.wrap_i64\n'
-    '    call $cabi_realloc\n'
-    '    local.set 4\n'
-    '    i32.const 0\n'
-    '    i32.const 0\n'
-    '    i32.const 4\n'
-    '    i32.const 8\n'
-    '    call $cabi_realloc\n'
-    '    local.set 5\n'
-    '    local.get 5\n'
-    '    local.get 4\n'
-    '    i32.store\n'
-    '    local.get 5\n'
-    '    local.get 1\n'
-    '    i32.wrap_i64\n'
-    '    i32.store offset=4\n'
-    '    i32.const 0\n'
-    '    i32.const 0\n'
-    '    i32.const 4\n'
-    '    i32.const 4\n'
-    '    call $cabi_realloc\n'
-    '    local.set 6\n'
-    '    local.get 0\n'
-    '    local.get 5\n'
-    '    i32.const 1\n'
-    '    local.get 2\n'
-    '    local.get 6\n'
-    '    call $__wasi_snapshot_preview1_fd_pread\n'
-    '    local.set 7\n'
-    '    local.get 7\n'
-    '    i32.eqz\n'
-    '    if\n'
-    '      local.get 3\n'
-    '      i32.const 0\n'
-    '      i32.store8\n'
-    '      local.get 3\n'
-    '      local.get 4\n'
-    '      i32.store offset=4\n'
-    '      local.get 3\n'
-    '      local.get 6\n'
-    '      i32.load\n'
-    '      i32.store offset=8\n'
-    '      local.get 3\n'
-    '      i32.const 0\n'
-    '      i32.store8 offset=12\n'
-    '    else\n'
-    '      local.get 3\n'
-    '      i32.const 1\n'
-    '      i32.store8\n'
-    '      local.get 3\n'
-    '      local.get 7\n'
-    '      i32.store8 offset=4\n'
-    '      local.get 4\n'
-    '      local.get 1\n'
-    '      i32.wrap_i64\n'
-    '      i32.const 1\n'
-    '      i32.const 0\n'
-    '      call $cabi_realloc\n'
-    '      drop\n'
-    '    end\n'
-    '    local.get 5\n'
-    '    i32.const 8\n'
-    '    i32.const 4\n'
-    '    i32.const 0\n'
-    '    call $cabi_realloc\n'
-    '    drop\n'
-    '    local.get 6\n'
-    '    i32.const 4\n'
-    '    i32.const 4\n'
-    '    i32.const 0\n'
-    '    call $cabi_realloc\n'
-    '    drop'
+    b'(local i32 i32 i32 i32)\n'
+    b'    i32.const 0\n'
+    b'    i32.const 0\n'
+    b'    i32.const 1\n'
+    b'    local.get 1\n'
+    b'    i32.wrap_i64\n'
+    b'    call $cabi_realloc\n'
+    b'    local.set 4\n'
+    b'    i32.const 0\n'
+    b'    i32.const 0\n'
+    b'    i32.const 4\n'
+    b'    i32.const 8\n'
+    b'    call $cabi_realloc\n'
+    b'    local.set 5\n'
+    b'    local.get 5\n'
+    b'    local.get 4\n'
+    b'    i32.store\n'
+    b'    local.get 5\n'
+    b'    local.get 1\n'
+    b'    i32.wrap_i64\n'
+    b'    i32.store offset=4\n'
+    b'    i32.const 0\n'
+    b'    i32.const 0\n'
+    b'    i32.const 4\n'
+    b'    i32.const 4\n'
+    b'    call $cabi_realloc\n'
+    b'    local.set 6\n'
+    b'    local.get 0\n'
+    b'    local.get 5\n'
+    b'    i32.const 1\n'
+    b'    local.get 2\n'
+    b'    local.get 6\n'
+    b'    call $__wasi_snapshot_preview1_fd_pread\n'
+    b'    local.set 7\n'
+    b'    local.get 7\n'
+    b'    i32.eqz\n'
+    b'    if\n'
+    b'      local.get 3\n'
+    b'      i32.const 0\n'
+    b'      i32.store8\n'
+    b'      local.get 3\n'
+    b'      local.get 4\n'
+    b'      i32.store offset=4\n'
+    b'      local.get 3\n'
+    b'      local.get 6\n'
+    b'      i32.load\n'
+    b'      i32.store offset=8\n'
+    b'      local.get 3\n'
+    b'      i32.const 0\n'
+    b'      i32.store8 offset=12\n'
+    b'    else\n'
+    b'      local.get 3\n'
+    b'      i32.const 1\n'
+    b'      i32.store8\n'
+    b'      local.get 3\n'
+    b'      local.get 7\n'
+    b'      i32.store8 offset=4\n'
+    b'      local.get 4\n'
+    b'      local.get 1\n'
+    b'      i32.wrap_i64\n'
+    b'      i32.const 1\n'
+    b'      i32.const 0\n'
+    b'      call $cabi_realloc\n'
+    b'      drop\n'
+    b'    end\n'
+    b'    local.get 5\n'
+    b'    i32.const 8\n'
+    b'    i32.const 4\n'
+    b'    i32.const 0\n'
+    b'    call $cabi_realloc\n'
+    b'    drop\n'
+    b'    local.get 6\n'
+    b'    i32.const 4\n'
+    b'    i32.const 4\n'
+    b'    i32.const 0\n'
+    b'    call $cabi_realloc\n'
+    b'    drop'
 )
 
 
 # Bridge descriptor.write to WASI Preview 1 fd_pwrite.
 _WRITE_BRIDGE_P1 = (
-    '(local i32 i32 i32)\n'
-    '    i32.const 0\n'
-    '    i32.const 0\n'
-    '    i32.const 4\n'
-    '    i32.const 8\n'
-    '    call $cabi_realloc\n'
-    '    local.set 5\n'
-    '    local.get 5\n'
-    '    local.get 1\n'
-    '    i32.store\n'
-    '    local.get 5\n'
-    '    local.get 2\n'
-    '    i32.store offset=4\n'
-    '    i32.const 0\n'
-    '    i32.const 0\n'
-    '    i32.const 4\n'
-    '    i32.const 4\n'
-    '    call $cabi_realloc\n'
-    '    local.set 6\n'
-    '    local.get 0\n'
-    '    local.get 5\n'
-    '    i32.const 1\n'
-    '    local.get 3\n'
-    '    local.get 6\n'
-    '    call $__wasi_snapshot_preview1_fd_pwrite\n'
-    '    local.set 7\n'
-    '    local.get 7\n'
-    '    i32.eqz\n'
-    '    if\n'
-    '      local.get 4\n'
-    '      i32.const 0\n'
-    '      i32.store8\n'
-    '      local.get 4\n'
-    '      local.get 6\n'
-    '      i32.load\n'
-    '      i64.extend_i32_u\n'
-    '      i64.store offset=8\n'
-    '    else\n'
-    '      local.get 4\n'
-    '      i32.const 1\n'
-    '      i32.store8\n'
-    '      local.get 4\n'
-    '      local.get 7\n'
-    '      i32.store8 offset=8\n'
-    '    end\n'
-    '    local.get 5\n'
-    '    i32.const 8\n'
-    '    i32.const 4\n'
-    '    i32.const 0\n'
-    '    call $cabi_realloc\n'
-    '    drop\n'
-    '    local.get 6\n'
-    '    i32.const 4\n'
-    '    i32.const 4\n'
-    '    i32.const 0\n'
-    '    call $cabi_realloc\n'
-    '    drop'
+    b'(local i32 i32 i32)\n'
+    b'    i32.const 0\n'
+    b'    i32.const 0\n'
+    b'    i32.const 4\n'
+    b'    i32.const 8\n'
+    b'    call $cabi_realloc\n'
+    b'    local.set 5\n'
+    b'    local.get 5\n'
+    b'    local.get 1\n'
+    b'    i32.store\n'
+    b'    local.get 5\n'
+    b'    local.get 2\n'
+    b'    i32.store offset=4\n'
+    b'    i32.const 0\n'
+    b'    i32.const 0\n'
+    b'    i32.const 4\n'
+    b'    i32.const 4\n'
+    b'    call $cabi_realloc\n'
+    b'    local.set 6\n'
+    b'    local.get 0\n'
+    b'    local.get 5\n'
+    b'    i32.const 1\n'
+    b'    local.get 3\n'
+    b'    local.get 6\n'
+    b'    call $__wasi_snapshot_preview1_fd_pwrite\n'
+    b'    local.set 7\n'
+    b'    local.get 7\n'
+    b'    i32.eqz\n'
+    b'    if\n'
+    b'      local.get 4\n'
+    b'      i32.const 0\n'
+    b'      i32.store8\n'
+    b'      local.get 4\n'
+    b'      local.get 6\n'
+    b'      i32.load\n'
+    b'      i64.extend_i32_u\n'
+    b'      i64.store offset=8\n'
+    b'    else\n'
+    b'      local.get 4\n'
+    b'      i32.const 1\n'
+    b'      i32.store8\n'
+    b'      local.get 4\n'
+    b'      local.get 7\n'
+    b'      i32.store8 offset=8\n'
+    b'    end\n'
+    b'    local.get 5\n'
+    b'    i32.const 8\n'
+    b'    i32.const 4\n'
+    b'    i32.const 0\n'
+    b'    call $cabi_realloc\n'
+    b'    drop\n'
+    b'    local.get 6\n'
+    b'    i32.const 4\n'
+    b'    i32.const 4\n'
+    b'    i32.const 0\n'
+    b'    call $cabi_realloc\n'
+    b'    drop'
 )
 
 
 # Bridge descriptor.metadata-hash to WASI Preview 1 fd_filestat_get.
 _METADATA_HASH_BRIDGE_P1 = (
-    '(local i32 i32)\n'
-    '    i32.const 0\n'
-    '    i32.const 0\n'
-    '    i32.const 8\n'
-    '    i32.const 64\n'
-    '    call $cabi_realloc\n'
-    '    local.set 2\n'
-    '    local.get 0\n'
-    '    local.get 2\n'
-    '    call $__wasi_snapshot_preview1_fd_filestat_get\n'
-    '    local.set 3\n'
-    '    local.get 3\n'
-    '    i32.eqz\n'
-    '    if\n'
-    '      local.get 1\n'
-    '      i32.const 0\n'
-    '      i32.store8\n'
-    '      local.get 1\n'
-    '      local.get 2\n'
-    '      i64.load\n'
-    '      i64.store offset=8\n'
-    '      local.get 1\n'
-    '      local.get 2\n'
-    '      i64.load offset=8\n'
-    '      i64.store offset=16\n'
-    '    else\n'
-    '      local.get 1\n'
-    '      i32.const 1\n'
-    '      i32.store8\n'
-    '      local.get 1\n'
-    '      local.get 3\n'
-    '      i32.store8 offset=8\n'
-    '    end\n'
-    '    local.get 2\n'
-    '    i32.const 64\n'
-    '    i32.const 8\n'
-    '    i32.const 0\n'
-    '    call $cabi_realloc\n'
-    '    drop'
+    b'(local i32 i32)\n'
+    b'    i32.const 0\n'
+    b'    i32.const 0\n'
+    b'    i32.const 8\n'
+    b'    i32.const 64\n'
+    b'    call $cabi_realloc\n'
+    b'    local.set 2\n'
+    b'    local.get 0\n'
+    b'    local.get 2\n'
+    b'    call $__wasi_snapshot_preview1_fd_filestat_get\n'
+    b'    local.set 3\n'
+    b'    local.get 3\n'
+    b'    i32.eqz\n'
+    b'    if\n'
+    b'      local.get 1\n'
+    b'      i32.const 0\n'
+    b'      i32.store8\n'
+    b'      local.get 1\n'
+    b'      local.get 2\n'
+    b'      i64.load\n'
+    b'      i64.store offset=8\n'
+    b'      local.get 1\n'
+    b'      local.get 2\n'
+    b'      i64.load offset=8\n'
+    b'      i64.store offset=16\n'
+    b'    else\n'
+    b'      local.get 1\n'
+    b'      i32.const 1\n'
+    b'      i32.store8\n'
+    b'      local.get 1\n'
+    b'      local.get 3\n'
+    b'      i32.store8 offset=8\n'
+    b'    end\n'
+    b'    local.get 2\n'
+    b'    i32.const 64\n'
+    b'    i32.const 8\n'
+    b'    i32.const 0\n'
+    b'    call $cabi_realloc\n'
+    b'    drop'
 )
 
 
 # Bridge descriptor.metadata-hash-at to WASI Preview 1 path_filestat_get.
 _METADATA_HASH_AT_BRIDGE_P1 = (
-    '(local i32 i32)\n'
-    '    i32.const 0\n'
-    '    i32.const 0\n'
-    '    i32.const 8\n'
-    '    i32.const 64\n'
-    '    call $cabi_realloc\n'
-    '    local.set 5\n'
-    '    local.get 0\n'
-    '    local.get 1\n'
-    '    local.get 2\n'
-    '    local.get 3\n'
-    '    local.get 5\n'
-    '    call $__wasi_snapshot_preview1_path_filestat_get\n'
-    '    local.set 6\n'
-    '    local.get 6\n'
-    '    i32.eqz\n'
-    '    if\n'
-    '      local.get 4\n'
-    '      i32.const 0\n'
-    '      i32.store8\n'
-    '      local.get 4\n'
-    '      local.get 5\n'
-    '      i64.load\n'
-    '      i64.store offset=8\n'
-    '      local.get 4\n'
-    '      local.get 5\n'
-    '      i64.load offset=8\n'
-    '      i64.store offset=16\n'
-    '    else\n'
-    '      local.get 4\n'
-    '      i32.const 1\n'
-    '      i32.store8\n'
-    '      local.get 4\n'
-    '      local.get 6\n'
-    '      i32.store8 offset=8\n'
-    '    end\n'
-    '    local.get 5\n'
-    '    i32.const 64\n'
-    '    i32.const 8\n'
-    '    i32.const 0\n'
-    '    call $cabi_realloc\n'
-    '    drop'
+    b'(local i32 i32)\n'
+    b'    i32.const 0\n'
+    b'    i32.const 0\n'
+    b'    i32.const 8\n'
+    b'    i32.const 64\n'
+    b'    call $cabi_realloc\n'
+    b'    local.set 5\n'
+    b'    local.get 0\n'
+    b'    local.get 1\n'
+    b'    local.get 2\n'
+    b'    local.get 3\n'
+    b'    local.get 5\n'
+    b'    call $__wasi_snapshot_preview1_path_filestat_get\n'
+    b'    local.set 6\n'
+    b'    local.get 6\n'
+    b'    i32.eqz\n'
+    b'    if\n'
+    b'      local.get 4\n'
+    b'      i32.const 0\n'
+    b'      i32.store8\n'
+    b'      local.get 4\n'
+    b'      local.get 5\n'
+    b'      i64.load\n'
+    b'      i64.store offset=8\n'
+    b'      local.get 4\n'
+    b'      local.get 5\n'
+    b'      i64.load offset=8\n'
+    b'      i64.store offset=16\n'
+    b'    else\n'
+    b'      local.get 4\n'
+    b'      i32.const 1\n'
+    b'      i32.store8\n'
+    b'      local.get 4\n'
+    b'      local.get 6\n'
+    b'      i32.store8 offset=8\n'
+    b'    end\n'
+    b'    local.get 5\n'
+    b'    i32.const 64\n'
+    b'    i32.const 8\n'
+    b'    i32.const 0\n'
+    b'    call $cabi_realloc\n'
+    b'    drop'
 )
 
 
 # Bridge descriptor.stat to WASI Preview 1 fd_filestat_get.
 _STAT_BRIDGE_P1 = (
-    '(local i32 i32 i32)\n'
-    '    i32.const 0\n'
-    '    i32.const 0\n'
-    '    i32.const 8\n'
-    '    i32.const 64\n'
-    '    call $cabi_realloc\n'
-    '    local.set 2\n'
-    '    local.get 0\n'
-    '    local.get 2\n'
-    '    call $__wasi_snapshot_preview1_fd_filestat_get\n'
-    '    local.set 3\n'
-    '    local.get 3\n'
-    '    i32.eqz\n'
-    '    if\n'
-    '      local.get 1\n'
-    '      i32.const 0\n'
-    '      i32.store8\n'
-    '      local.get 1\n'
-    '      local.get 2\n'
-    '      i32.load8_u offset=16\n'
-    '      local.set 4\n'
-    '      local.get 4\n'
-    '      i32.const 7\n'
-    '      i32.eq\n'
-    '      if\n'
-    '        i32.const 5\n'
-    '        local.set 4\n'
-    '      end\n'
-    '      local.get 4\n'
-    '      i32.const 6\n'
-    '      i32.eq\n'
-    '      if\n'
-    '        i32.const 7\n'
-    '        local.set 4\n'
-    '      end\n'
-    '      local.get 4\n'
-    '      i32.const 5\n'
-    '      i32.eq\n'
-    '      if\n'
-    '        i32.const 7\n'
-    '        local.set 4\n'
-    '      end\n'
-    '      local.get 4\n'
-    '      i32.const 4\n'
-    '      i32.eq\n'
-    '      if\n'
-    '        i32.const 6\n'
-    '        local.set 4\n'
-    '      end\n'
-    '      local.get 4\n'
-    '      i32.store8 offset=8\n'
-    '      local.get 1\n'
-    '      local.get 2\n'
-    '      i64.load offset=24\n'
-    '      i64.store offset=16\n'
-    '      local.get 1\n'
-    '      local.get 2\n'
-    '      i64.load offset=32\n'
-    '      i64.store offset=24\n'
-    '      local.get 1\n'
-    '      i32.const 0\n'
-    '      i32.store8 offset=32\n'
-    '      local.get 1\n'
-    '      i32.const 0\n'
-    '      i32.store8 offset=56\n'
-    '      local.get 1\n'
-    '      i32.const 0\n'
-    '      i32.store8 offset=80\n'
-    '    else\n'
-    '      local.get 1\n'
-    '      i32.const 1\n'
-    '      i32.store8\n'
-    '      local.get 1\n'
-    '      local.get 3\n'
-    '      i32.store8 offset=16\n'
-    '    end\n'
-    '    local.get 2\n'
-    '    i32.const 64\n'
-    '    i32.const 8\n'
-    '    i32.const 0\n'
-    '    call $cabi_realloc\n'
-    '    drop'
+    b'(local i32 i32 i32)\n'
+    b'    i32.const 0\n'
+    b'    i32.const 0\n'
+    b'    i32.const 8\n'
+    b'    i32.const 64\n'
+    b'    call $cabi_realloc\n'
+    b'    local.set 2\n'
+    b'    local.get 0\n'
+    b'    local.get 2\n'
+    b'    call $__wasi_snapshot_preview1_fd_filestat_get\n'
+    b'    local.set 3\n'
+    b'    local.get 3\n'
+    b'    i32.eqz\n'
+    b'    if\n'
+    b'      local.get 1\n'
+    b'      i32.const 0\n'
+    b'      i32.store8\n'
+    b'      local.get 1\n'
+    b'      local.get 2\n'
+    b'      i32.load8_u offset=16\n'
+    b'      call $__clip_filetype_xlate\n'
+    b'      local.set 4\n'
+    b'      local.get 4\n'
+    b'      i32.store8 offset=8\n'
+    b'      local.get 1\n'
+    b'      local.get 2\n'
+    b'      i64.load offset=24\n'
+    b'      i64.store offset=16\n'
+    b'      local.get 1\n'
+    b'      local.get 2\n'
+    b'      i64.load offset=32\n'
+    b'      i64.store offset=24\n'
+    b'      local.get 1\n'
+    b'      i32.const 0\n'
+    b'      i32.store8 offset=32\n'
+    b'      local.get 1\n'
+    b'      i32.const 0\n'
+    b'      i32.store8 offset=56\n'
+    b'      local.get 1\n'
+    b'      i32.const 0\n'
+    b'      i32.store8 offset=80\n'
+    b'    else\n'
+    b'      local.get 1\n'
+    b'      i32.const 1\n'
+    b'      i32.store8\n'
+    b'      local.get 1\n'
+    b'      local.get 3\n'
+    b'      i32.store8 offset=16\n'
+    b'    end\n'
+    b'    local.get 2\n'
+    b'    i32.const 64\n'
+    b'    i32.const 8\n'
+    b'    i32.const 0\n'
+    b'    call $cabi_realloc\n'
+    b'    drop'
 )
 
 
 # Bridge descriptor.stat-at to WASI Preview 1 path_filestat_get.
 _STAT_AT_BRIDGE_P1 = (
-    '(local i32 i32 i32)\n'
-    '    i32.const 0\n'
-    '    i32.const 0\n'
-    '    i32.const 8\n'
-    '    i32.const 64\n'
-    '    call $cabi_realloc\n'
-    '    local.set 5\n'
-    '    local.get 0\n'
-    '    local.get 1\n'
-    '    local.get 2\n'
-    '    local.get 3\n'
-    '    local.get 5\n'
-    '    call $__wasi_snapshot_preview1_path_filestat_get\n'
-    '    local.set 6\n'
-    '    local.get 6\n'
-    '    i32.eqz\n'
-    '    if\n'
-    '      local.get 4\n'
-    '      i32.const 0\n'
-    '      i32.store8\n'
-    '      local.get 4\n'
-    '      local.get 5\n'
-    '      i32.load8_u offset=16\n'
-    '      local.set 7\n'
-    '      local.get 7\n'
-    '      i32.const 7\n'
-    '      i32.eq\n'
-    '      if\n'
-    '        i32.const 5\n'
-    '        local.set 7\n'
-    '      end\n'
-    '      local.get 7\n'
-    '      i32.const 6\n'
-    '      i32.eq\n'
-    '      if\n'
-    '        i32.const 7\n'
-    '        local.set 7\n'
-    '      end\n'
-    '      local.get 7\n'
-    '      i32.const 5\n'
-    '      i32.eq\n'
-    '      if\n'
-    '        i32.const 7\n'
-    '        local.set 7\n'
-    '      end\n'
-    '      local.get 7\n'
-    '      i32.const 4\n'
-    '      i32.eq\n'
-    '      if\n'
-    '        i32.const 6\n'
-    '        local.set 7\n'
-    '      end\n'
-    '      local.get 7\n'
-    '      i32.store8 offset=8\n'
-    '      local.get 4\n'
-    '      local.get 5\n'
-    '      i64.load offset=24\n'
-    '      i64.store offset=16\n'
-    '      local.get 4\n'
-    '      local.get 5\n'
-    '      i64.load offset=32\n'
-    '      i64.store offset=24\n'
-    '      local.get 4\n'
-    '      i32.const 0\n'
-    '      i32.store8 offset=32\n'
-    '      local.get 4\n'
-    '      i32.const 0\n'
-    '      i32.store8 offset=56\n'
-    '      local.get 4\n'
-    '      i32.const 0\n'
-    '      i32.store8 offset=80\n'
-    '    else\n'
-    '      local.get 4\n'
-    '      i32.const 1\n'
-    '      i32.store8\n'
-    '      local.get 4\n'
-    '      local.get 6\n'
-    '      i32.store8 offset=16\n'
-    '    end\n'
-    '    local.get 5\n'
-    '    i32.const 64\n'
-    '    i32.const 8\n'
-    '    i32.const 0\n'
-    '    call $cabi_realloc\n'
-    '    drop'
+    b'(local i32 i32 i32)\n'
+    b'    i32.const 0\n'
+    b'    i32.const 0\n'
+    b'    i32.const 8\n'
+    b'    i32.const 64\n'
+    b'    call $cabi_realloc\n'
+    b'    local.set 5\n'
+    b'    local.get 0\n'
+    b'    local.get 1\n'
+    b'    local.get 2\n'
+    b'    local.get 3\n'
+    b'    local.get 5\n'
+    b'    call $__wasi_snapshot_preview1_path_filestat_get\n'
+    b'    local.set 6\n'
+    b'    local.get 6\n'
+    b'    i32.eqz\n'
+    b'    if\n'
+    b'      local.get 4\n'
+    b'      i32.const 0\n'
+    b'      i32.store8\n'
+    b'      local.get 4\n'
+    b'      local.get 5\n'
+    b'      i32.load8_u offset=16\n'
+    b'      call $__clip_filetype_xlate\n'
+    b'      local.set 7\n'
+    b'      local.get 7\n'
+    b'      i32.store8 offset=8\n'
+    b'      local.get 4\n'
+    b'      local.get 5\n'
+    b'      i64.load offset=24\n'
+    b'      i64.store offset=16\n'
+    b'      local.get 4\n'
+    b'      local.get 5\n'
+    b'      i64.load offset=32\n'
+    b'      i64.store offset=24\n'
+    b'      local.get 4\n'
+    b'      i32.const 0\n'
+    b'      i32.store8 offset=32\n'
+    b'      local.get 4\n'
+    b'      i32.const 0\n'
+    b'      i32.store8 offset=56\n'
+    b'      local.get 4\n'
+    b'      i32.const 0\n'
+    b'      i32.store8 offset=80\n'
+    b'    else\n'
+    b'      local.get 4\n'
+    b'      i32.const 1\n'
+    b'      i32.store8\n'
+    b'      local.get 4\n'
+    b'      local.get 6\n'
+    b'      i32.store8 offset=16\n'
+    b'    end\n'
+    b'    local.get 5\n'
+    b'    i32.const 64\n'
+    b'    i32.const 8\n'
+    b'    i32.const 0\n'
+    b'    call $cabi_realloc\n'
+    b'    drop'
 )
 
 
 # Bridge wasi:cli/exit exit() -> wasi_snapshot_preview1.proc_exit()
 _EXIT_BRIDGE_P1 = (
-    'local.get 0\n'
-    '    call $__wasi_snapshot_preview1_proc_exit\n'
-    '    unreachable'
+    b'local.get 0\n'
+    b'    call $__wasi_snapshot_preview1_proc_exit\n'
+    b'    unreachable'
 )
 
 
-def perform_wasi_stubbing(
-    content: str,
-    stub_wasi: bool = True,
-    stub_env: bool = True,
-    use_wasi_p1_bridge: bool = False,
-) -> str:
-    """Replace selected imports with stub function definitions.
+# Shared helper translating a Preview 1 filestat filetype byte to the
+# Preview 2 descriptor-type discriminant, emitted once per module instead of
+# inlining the comparison chain in each of the stat/stat-at/get-type bridges.
+# The checks deliberately run in order (7 -> 5 -> 7), so the net mapping is
+# 7 -> 7, 6 -> 7, 5 -> 7, 4 -> 6 — keep the chain verbatim.
+_FILETYPE_XLATE_FUNC = (
+    b'  (func $__clip_filetype_xlate (param i32) (result i32)\n'
+    b'    local.get 0\n'
+    b'    i32.const 7\n'
+    b'    i32.eq\n'
+    b'    if\n'
+    b'      i32.const 5\n'
+    b'      local.set 0\n'
+    b'    end\n'
+    b'    local.get 0\n'
+    b'    i32.const 6\n'
+    b'    i32.eq\n'
+    b'    if\n'
+    b'      i32.const 7\n'
+    b'      local.set 0\n'
+    b'    end\n'
+    b'    local.get 0\n'
+    b'    i32.const 5\n'
+    b'    i32.eq\n'
+    b'    if\n'
+    b'      i32.const 7\n'
+    b'      local.set 0\n'
+    b'    end\n'
+    b'    local.get 0\n'
+    b'    i32.const 4\n'
+    b'    i32.eq\n'
+    b'    if\n'
+    b'      i32.const 6\n'
+    b'      local.set 0\n'
+    b'    end\n'
+    b'    local.get 0\n'
+    b'  )\n'
+)
+
 
-    If `stub_wasi` is true, WASI 0.2.0 imports are stubbed with safe defaults.
+# Pre-wrap every bridge body into the exact bytes spliced between a truncated
+# func decl and its closing paren, once at import time instead of per stub.
+for _name, _val in list(globals().items()):
+    if _name.endswith('_BRIDGE') or _name.endswith('_BRIDGE_P1'):
+        globals()[_name] = b'\n    ' + _val + b'\n  '
+del _name, _val
+
+
+# WASI Preview 1 imports required by the bridge shims, inserted on demand
+# when --wasi-p1-bridge is enabled.
+_P1_IMPORTS = [
+    ('random_get', '(func $__wasi_snapshot_preview1_random_get (param i32 i32) (result i32))'),
+    ('clock_time_get', '(func $__wasi_snapshot_preview1_clock_time_get (param i32 i64 i32) (result i32))'),
+    ('proc_exit', '(func $__wasi_snapshot_preview1_proc_exit (param i32))'),
+    ('fd_prestat_get', '(func $__wasi_snapshot_preview1_fd_prestat_get (param i32 i32) (result i32))'),
+    ('fd_prestat_dir_name', '(func $__wasi_snapshot_preview1_fd_prestat_dir_name (param i32 i32 i32) (result i32))'),
+    ('fd_readdir', '(func $__wasi_snapshot_preview1_fd_readdir (param i32 i32 i32 i64 i32) (result i32))'),
+    ('fd_read', '(func $__wasi_snapshot_preview1_fd_read (param i32 i32 i32 i32) (result i32))'),
+    ('fd_write', '(func $__wasi_snapshot_preview1_fd_write (param i32 i32 i32 i32) (result i32))'),
+    ('fd_pread', '(func $__wasi_snapshot_preview1_fd_pread (param i32 i32 i32 i64 i32) (result i32))'),
+    ('fd_pwrite', '(func $__wasi_snapshot_preview1_fd_pwrite (param i32 i32 i32 i64 i32) (result i32))'),
+    ('fd_seek', '(func $__wasi_snapshot_preview1_fd_seek (param i32 i64 i32 i32) (result i32))'),
+    ('path_open', '(func $__wasi_snapshot_preview1_path_open (param i32 i32 i32 i32 i32 i64 i64 i32 i32) (result i32))'),
+    ('fd_filestat_get', '(func $__wasi_snapshot_preview1_fd_filestat_get (param i32 i32) (result i32))'),
+    ('path_filestat_get', '(func $__wasi_snapshot_preview1_path_filestat_get (param i32 i32 i32 i32 i32) (result i32))'),
+]
+
+
+@functools.lru_cache(maxsize=2)
+def _stub_instruction_table(use_wasi_p1_bridge: bool) -> dict[tuple[bytes, bytes], bytes | None]:
+    """Map `(namespace, func)` -> replacement instruction for WASI 0.2.0 imports.
+
+    `None` means "stub with default return values for the signature".
     Special cases:
     - get-random-bytes: bridges via cabi_realloc to return a valid list<u8>
       (prevents crashes in .NET runtime hash code / ArrayPool initialization)
     - exit: uses unreachable (exit should never return)
 
-    If `stub_env` is true, remaining `env` imports are also stubbed.
-    If `use_wasi_p1_bridge` is true, selected WASI P2 shims call
+    If `use_wasi_p1_bridge` is true, selected shims call
     `wasi_snapshot_preview1` functions instead of no-op/unreachable stubs.
     """
-    if not stub_wasi:
-        if not stub_env:
-            return content
-
-        env_pattern = re.compile(r'\(\s*import\s*"(env)"\s*"([^"]+)"')
-        while True:
-            match = env_pattern.search(content)
-            if not match:
-                break
-            ns_raw, func_name = match.group(1), match.group(2)
-            content = stub_import(content, re.escape(ns_raw), func_name, None, verbose_prefix='[env catch-all] ')
-        return content
-
-    io_error_drop_instr = 'unreachable'
-    exit_instr = 'unreachable'
-    stdin_get_instr = 'unreachable'
-    stdout_get_instr = 'unreachable'
-    stderr_get_instr = 'unreachable'
-    output_stream_subscribe_instr = 'unreachable'
-    monotonic_now_instr = 'i64.const 0'
-    monotonic_subscribe_instr = 'unreachable'
+    io_error_drop_instr = b'unreachable'
+    exit_instr = b'unreachable'
+    stdin_get_instr = b'unreachable'
+    stdout_get_instr = b'unreachable'
+    stderr_get_instr = b'unreachable'
+    output_stream_subscribe_instr = b'unreachable'
+    monotonic_now_instr = b'i64.const 0'
+    monotonic_subscribe_instr = b'unreachable'
     wall_clock_now_instr = None
     get_directories_instr = None
     directory_entry_stream_drop_instr = None
@@ -1364,98 +1431,14 @@ def perform_wasi_stubbing(
     random_bytes_instr = _RANDOM_GET_BYTES_BRIDGE
 
     if use_wasi_p1_bridge:
-        content = ensure_func_import(
-            content,
-            'wasi_snapshot_preview1',
-            'random_get',
-            '(func $__wasi_snapshot_preview1_random_get (param i32 i32) (result i32))',
-        )
-        content = ensure_func_import(
-            content,
-            'wasi_snapshot_preview1',
-            'clock_time_get',
-            '(func $__wasi_snapshot_preview1_clock_time_get (param i32 i64 i32) (result i32))',
-        )
-        content = ensure_func_import(
-            content,
-            'wasi_snapshot_preview1',
-            'proc_exit',
-            '(func $__wasi_snapshot_preview1_proc_exit (param i32))',
-        )
-        content = ensure_func_import(
-            content,
-            'wasi_snapshot_preview1',
-            'fd_prestat_get',
-            '(func $__wasi_snapshot_preview1_fd_prestat_get (param i32 i32) (result i32))',
-        )
-        content = ensure_func_import(
-            content,
-            'wasi_snapshot_preview1',
-            'fd_prestat_dir_name',
-            '(func $__wasi_snapshot_preview1_fd_prestat_dir_name (param i32 i32 i32) (result i32))',
-        )
-        content = ensure_func_import(
-            content,
-            'wasi_snapshot_preview1',
-            'fd_readdir',
-            '(func $__wasi_snapshot_preview1_fd_readdir (param i32 i32 i32 i64 i32) (result i32))',
-        )
-        content = ensure_func_import(
-            content,
-            'wasi_snapshot_preview1',
-            'fd_read',
-            '(func $__wasi_snapshot_preview1_fd_read (param i32 i32 i32 i32) (result i32))',
-        )
-        content = ensure_func_import(
-            content,
-            'wasi_snapshot_preview1',
-            'fd_write',
-            '(func $__wasi_snapshot_preview1_fd_write (param i32 i32 i32 i32) (result i32))',
-        )
-        content = ensure_func_import(
-            content,
-            'wasi_snapshot_preview1',
-            'fd_pread',
-            '(func $__wasi_snapshot_preview1_fd_pread (param i32 i32 i32 i64 i32) (result i32))',
-        )
-        content = ensure_func_import(
-            content,
-            'wasi_snapshot_preview1',
-            'fd_pwrite',
-            '(func $__wasi_snapshot_preview1_fd_pwrite (param i32 i32 i32 i64 i32) (result i32))',
-        )
-        content = ensure_func_import(
-            content,
-            'wasi_snapshot_preview1',
-            'fd_seek',
-            '(func $__wasi_snapshot_preview1_fd_seek (param i32 i64 i32 i32) (result i32))',
-        )
-        content = ensure_func_import(
-            content,
-            'wasi_snapshot_preview1',
-            'path_open',
-            '(func $__wasi_snapshot_preview1_path_open (param i32 i32 i32 i32 i32 i64 i64 i32 i32) (result i32))',
-        )
-        content = ensure_func_import(
-            content,
-            'wasi_snapshot_preview1',
-            'fd_filestat_get',
-            '(func $__wasi_snapshot_preview1_fd_filestat_get (param i32 i32) (result i32))',
-        )
-        content = ensure_func_import(
-            content,
-            'wasi_snapshot_preview1',
-            'path_filestat_get',
-            '(func $__wasi_snapshot_preview1_path_filestat_get (param i32 i32 i32 i32 i32) (result i32))',
-        )
-        io_error_drop_instr = 'nop'
+        io_error_drop_instr = b'nop'
         exit_instr = _EXIT_BRIDGE_P1
-        stdin_get_instr = 'i32.const 0'
-        stdout_get_instr = 'i32.const 1'
-        stderr_get_instr = 'i32.const 2'
-        output_stream_subscribe_instr = 'i32.const 0'
+        stdin_get_instr = b'i32.const 0'
+        stdout_get_instr = b'i32.const 1'
+        stderr_get_instr = b'i32.const 2'
+        output_stream_subscribe_instr = b'i32.const 0'
         monotonic_now_instr = _MONOTONIC_NOW_BRIDGE_P1
-        monotonic_subscribe_instr = 'i32.const 0'
+        monotonic_subscribe_instr = b'i32.const 0'
         wall_clock_now_instr = _WALL_CLOCK_NOW_BRIDGE_P1
         get_directories_instr = _GET_DIRECTORIES_BRIDGE_P1
         directory_entry_stream_drop_instr = _DIRECTORY_ENTRY_STREAM_DROP_BRIDGE_P1
@@ -1493,7 +1476,7 @@ def perform_wasi_stubbing(
         ('wasi:cli/exit',                    'exit',                                     exit_instr),
         ('wasi:io/poll',                     '[method]pollable.block',                   None),
         ('wasi:io/poll',                     'poll',                                     None),
-        ('wasi:io/streams',                  '[method]input-stream.subscribe',           'unreachable'),
+        ('wasi:io/streams',                  '[method]input-stream.subscribe',           b'unreachable'),
         ('wasi:io/streams',                  '[method]input-stream.blocking-read',       input_stream_blocking_read_instr),
         ('wasi:io/streams',                  '[method]output-stream.check-write',        output_stream_check_write_instr),
         ('wasi:io/streams',                  '[method]output-stream.write',              output_stream_write_instr),
@@ -1529,72 +1512,162 @@ def perform_wasi_stubbing(
         ('wasi:random/random',               'get-random-bytes',                         random_bytes_instr),
     ]
 
-    for ns, func, repl_instr in stubs:
-        ns_pat = re.escape(ns) + r'@\d+\.\d+\.\d+'
-        content = stub_import(content, ns_pat, func, repl_instr)
-
-    # Catch-all: stub any remaining wasi: imports not covered by the explicit list
-    wasi_pattern = re.compile(r'\(\s*import\s*"(wasi:[^"]+)"\s*"([^"]+)"')
-    while True:
-        match = wasi_pattern.search(content)
-        if not match:
-            break
-        ns_raw, func_name = match.group(1), match.group(2)
-        content = stub_import(content, re.escape(ns_raw), func_name, None, verbose_prefix='[wasi catch-all] ')
-
-    # NOTE: wasi_snapshot_preview1 imports are NOT stubbed — Extism provides them natively
-    # when the plugin is loaded with withWasi: true (random_get, fd_write, clock_time_get, etc.)
-
-    if not stub_env:
-        return content
-
-    # Catch-all: stub any remaining "env" imports (pthread, etc. from NativeAOT runtime)
-    env_pattern = re.compile(r'\(\s*import\s*"(env)"\s*"([^"]+)"')
-    while True:
-        match = env_pattern.search(content)
-        if not match:
-            break
-        ns_raw, func_name = match.group(1), match.group(2)
-        content = stub_import(content, re.escape(ns_raw), func_name, None, verbose_prefix='[env catch-all] ')
+    return {(ns.encode('utf-8'), func.encode('utf-8')): repl_instr for ns, func, repl_instr in stubs}
 
-    return content
 
+@functools.lru_cache(maxsize=16)
+def _head_pattern(namespaces: tuple[bytes, ...], convert_exports: bool) -> re.Pattern:
+    """One alternation matching every construct the head pass rewrites.
 
-def fix_undefined_stubs(content: str) -> str:
+    Branch order matters: explicit conversion namespaces win over the plain
+    `env` branch so a renamed namespace is still recognized as `env` by the
+    dispatch below.
+    """
+    branches = [rb'\(\s*import\s*"(?P<wns>wasi:[^"]+)"\s*"[^"]+"']
+    if namespaces:
+        alt = b'|'.join(re.escape(ns) for ns in namespaces)
+        branches.append(rb'\(\s*import\s*"(?P<cns>' + alt + rb')"\s*"(?P<cfn>[^"]*)"')
+    branches.append(rb'\(\s*import\s*"(?P<ens>env)"\s*"[^"]+"')
+    if convert_exports:
+        branches.append(rb'\(\s*export\s*"(?P<exp>[^"]*)"')
+    return re.compile(b'|'.join(branches))
+
+
+def process_head(
+    content: bytes,
+    namespaces: list[str],
+    stub_wasi: bool = True,
+    stub_env: bool = True,
+    use_wasi_p1_bridge: bool = False,
+    convert_exports: bool = True,
+) -> bytes:
+    """Rewrite the WAT head in a single sweep.
+
+    Fuses namespace conversion, export name conversion and import stubbing:
+    one finditer pass over the (immutable) content dispatches each match to
+    the right rewrite and records `(start, end, replacement)` edits that are
+    applied with a single rebuild, instead of three separate full scans.
+
+    If `stub_wasi` is true, WASI 0.2.0 imports are stubbed with safe defaults
+    from `_stub_instruction_table`; other `wasi:` imports get default-return
+    stubs. `wasi_snapshot_preview1` imports are NOT stubbed — Extism provides
+    them natively when the plugin is loaded with withWasi: true (random_get,
+    fd_write, clock_time_get, etc.)
+
+    If `stub_env` is true, `env` imports (pthread, etc. from the NativeAOT
+    runtime) are stubbed with default returns.
+    """
+    if stub_wasi and use_wasi_p1_bridge:
+        content = ensure_func_imports(content, 'wasi_snapshot_preview1', _P1_IMPORTS)
+        if b'$__clip_filetype_xlate' not in content:
+            insert_at = _find_import_insert_point(content)
+            content = content[:insert_at] + _FILETYPE_XLATE_FUNC + content[insert_at:]
+
+    stub_table = _stub_instruction_table(use_wasi_p1_bridge) if stub_wasi else None
+    type_index = _build_type_index(content) if (stub_wasi or stub_env) else None
+    pattern = _head_pattern(tuple(ns.encode('utf-8') for ns in namespaces), convert_exports)
+
+    edits = []
+    last = 0
+    for m in pattern.finditer(content):
+        if m.start() < last:
+            continue
+        groups = m.groupdict()
+
+        if groups.get('wns') is not None:
+            if not stub_wasi:
+                continue
+            versioned = _VERSIONED_WASI_IMPORT_RE.match(content, m.start())
+            repl_instr = None
+            prefix = '[wasi catch-all] '
+            if versioned is not None:
+                key = (versioned.group(1), versioned.group(2))
+                if key in stub_table:
+                    repl_instr = stub_table[key]
+                    prefix = ''
+            import_end, stub, effective_instr = _stub_replacement(content, m.start(), repl_instr, type_index)
+            _print_stubbed(m.group(0), repl_instr, effective_instr, prefix)
+            edits.append((m.start(), import_end, stub))
+            last = import_end
+
+        elif groups.get('cns') is not None and not (groups['cns'] == b'env' and stub_env):
+            edits.append((m.start(), m.end(),
+                          b'(import "' + kebab_to_snake(groups['cns'])
+                          + b'" "' + kebab_to_snake(groups['cfn']) + b'"'))
+            last = m.end()
+
+        elif groups.get('cns') is not None or groups.get('ens') is not None:
+            if not stub_env:
+                continue
+            import_end, stub, effective_instr = _stub_replacement(content, m.start(), None, type_index)
+            _print_stubbed(m.group(0), None, effective_instr, '[env catch-all] ')
+            edits.append((m.start(), import_end, stub))
+            last = import_end
+
+        elif groups.get('exp') is not None:
+            edits.append((m.start(), m.end(),
+                          b'(export "' + kebab_to_snake(groups['exp']) + b'"'))
+            last = m.end()
+
+    return _apply_edits(content, edits)
+
+
+def fix_undefined_stubs(content: bytes) -> bytes:
     """Replace `unreachable` in linker-generated undefined_stub functions with safe defaults.
 
     NativeAOT emits local `undefined_stub` functions for unresolved symbols (e.g. pthread).
     These contain `unreachable` which traps at runtime. Replace with default return values.
     """
-    # Match both $undefined_stub and $"#funcN undefined_stub" patterns
-    pattern = re.compile(r'\(func\s+\$(?:undefined_stub|"[^"]*undefined_stub[^"]*")')
-
-    offset = 0
-    while True:
-        match = pattern.search(content, offset)
-        if not match:
-            break
-
+    type_index = _build_type_index(content)
+    edits = []
+    last = 0
+    for match in _UNDEFINED_STUB_RE.finditer(content):
         func_start = match.start()
+        if func_start < last:
+            continue
         func_end = find_balanced_parens(content, func_start)
-        func_text = content[func_start:func_end]
 
-        # Get the return instructions based on the function's result type
-        ret_instrs = _default_return_instrs(func_text, content)
+        # Only the first `unreachable` token gets rewritten, so the edit can
+        # cover just that token instead of copying the whole function body.
+        unreachable_at = content.find(b'unreachable', func_start, func_end)
+        if unreachable_at >= 0:
+            # The signature sits on the header line; the body never feeds the
+            # default-return lookup.
+            header_end = content.find(b'\n', func_start, func_end)
+            header = content[func_start:header_end if header_end >= 0 else func_end]
+            ret_instrs = _default_return_instrs(header, content, type_index)
 
-        if ret_instrs:
-            new_func = func_text.replace('unreachable', ret_instrs, 1)
-        else:
-            new_func = func_text.replace('unreachable', 'nop', 1)
+            name_display = header[:60].strip().decode('utf-8', errors='replace')
+            instr_display = (ret_instrs or b'nop').decode('utf-8', errors='replace')
+            _log(f'    Fixed undefined_stub: {name_display} -> {instr_display}')
+            edits.append((unreachable_at, unreachable_at + len(b'unreachable'), ret_instrs or b'nop'))
 
-        if new_func != func_text:
-            name_end = min(60, func_text.find('\n') if '\n' in func_text else 60)
-            print(f'    Fixed undefined_stub: {func_text[:name_end].strip()} -> {ret_instrs or "nop"}', file=sys.stderr)
+        last = func_end
+
+    return _apply_edits(content, edits)
+
+
+def _write_output(path: str, data: bytes) -> None:
+    """Write `data` to `path` through a raw fd.
+
+    A single os.write hands the whole buffer to the kernel at once, instead of
+    Python's buffered layer fragmenting a multi-MB payload into block-sized
+    writes.
+    """
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        view = memoryview(data)
+        while view:
+            written = os.write(fd, view)
+            view = view[written:]
+    finally:
+        os.close(fd)
 
-        content = content[:func_start] + new_func + content[func_end:]
-        offset = func_start + len(new_func)
 
-    return content
+@functools.lru_cache(maxsize=1)
+def _wasm_tools_exe() -> str:
+    """Absolute path of the wasm-tools binary, resolved once per run."""
+    return shutil.which('wasm-tools') or 'wasm-tools'
 
 
 def run_command(cmd: list[str], input_data: bytes | None = None) -> bytes:
@@ -1626,9 +1699,10 @@ def main():
              'If combined with --wat, outputs the unbundled WAT.',
     )
     parser.add_argument(
-        '--view', type=int, default=200,
-        help='Lookahead multiplier for WAT processing (default: 200). '
-             'Multiplied by 100 to get character count. 0 = process entire file.',
+        '--view', type=int, default=None,
+        help='Lookahead multiplier for WAT processing, multiplied by 100 to '
+             'get character count; 0 = process entire file. By default the '
+             'head is clipped at the first function definition instead.',
     )
     parser.add_argument(
         '--tmp-dir', default=None,
@@ -1647,12 +1721,23 @@ def main():
         '--wasi-p1-bridge', action='store_true',
         help='When stubbing WASI P2 imports, bridge key calls via wasi_snapshot_preview1 imports.',
     )
+    parser.add_argument(
+        '--no-opt', action='store_true',
+        help='Skip the wasm-opt -Oz size optimization pass on the final module.',
+    )
     args = parser.parse_args()
 
     convert_namespaces = [ns.strip() for ns in args.namespaces.split(',') if ns.strip()]
 
     custom_tmp_dir = args.tmp_dir is not None
-    tmp_dir = os.path.abspath(args.tmp_dir) if custom_tmp_dir else tempfile.mkdtemp(prefix='clip_wasm_')
+    if custom_tmp_dir:
+        tmp_dir = os.path.abspath(args.tmp_dir)
+    else:
+        # Prefer tmpfs so the unbundled module and WAT never round-trip
+        # through a physical disk.
+        shm = '/dev/shm'
+        base = shm if os.path.isdir(shm) and os.access(shm, os.W_OK) else None
+        tmp_dir = tempfile.mkdtemp(prefix='clip_wasm_', dir=base)
 
     if custom_tmp_dir:
         if os.path.exists(tmp_dir):
@@ -1663,7 +1748,7 @@ def main():
         # Step 1: Unbundle the component model WASM to get the bare module
         print('  Unbundling component...', file=sys.stderr)
         run_command([
-            'wasm-tools', 'component', 'unbundle',
+            _wasm_tools_exe(), 'component', 'unbundle',
             '--module-dir', tmp_dir,
             args.input,
         ])
@@ -1679,78 +1764,109 @@ def main():
 
         if args.pre and not args.wat:
             print('  Writing unbundled WASM to output...', file=sys.stderr)
-            with open(unbundled_module, 'rb') as f:
-                data = f.read()
-            with open(args.output, 'wb') as f:
-                f.write(data)
+            # Kernel-level copy (sendfile/copy_file_range on Linux); the module
+            # bytes never materialize in Python.
+            shutil.copyfile(unbundled_module, args.output)
             return
 
         # Step 2: Convert to WAT
         print('  Converting to WAT...', file=sys.stderr)
+        # Write straight to a temp file instead of capturing stdout: skips the
+        # incremental pipe reads and buffer regrowth for multi-MB modules.
+        wat_path = os.path.join(tmp_dir, 'unbundled-module.wat')
         # Prefer naming unnamed items so later text edits are robust even when
         # the module was built with aggressive stripping (numeric-only refs).
         try:
-            wat_bytes = run_command(['wasm-tools', 'print', '--name-unnamed', unbundled_module])
+            run_command([_wasm_tools_exe(), 'print', '--name-unnamed', unbundled_module, '-o', wat_path])
         except RuntimeError as exc:
             err = str(exc)
             if '--name-unnamed' in err and ('unexpected argument' in err or 'Found argument' in err):
-                wat_bytes = run_command(['wasm-tools', 'print', unbundled_module])
+                run_command([_wasm_tools_exe(), 'print', unbundled_module, '-o', wat_path])
             else:
                 raise
-        wat = wat_bytes.decode('utf-8')
-
+        # WAT is ASCII: keep the whole pipeline on bytes to skip the
+        # decode/encode round trip and halve the working-set size.
         if args.pre:
             print('  Writing unbundled WAT to output...', file=sys.stderr)
-            with open(args.output, 'w', encoding='utf-8') as f:
-                f.write(wat)
+            shutil.copyfile(wat_path, args.output)
             return
 
+        with open(wat_path, 'rb') as f:
+            wat = f.read()
+
         # Step 3: Process the WAT (only the head for efficiency)
-        view = (args.view or 0) * 100
+        if args.view is None:
+            # Clip exactly at the first top-level function definition: the
+            # declarations the head pass rewrites all precede it, and function
+            # bodies (the bulk of the WAT) never get scanned.
+            head_end = wat.find(b'\n  (func ')
+            view = head_end + 1 if head_end >= 0 else 0
+        else:
+            view = args.view * 100
         if view > 0:
             head = wat[:view]
             tail = wat[view:]
         else:
             head = wat
-            tail = ''
-
-        print(f'  Performing namespace conversion ({", ".join(convert_namespaces)})...', file=sys.stderr)
-        head = namespace_conversion(head, convert_namespaces)
-
-        print('  Performing export name conversion...', file=sys.stderr)
-        head = export_name_conversion(head)
+            tail = b''
 
+        print(f'  Rewriting WAT head (namespaces: {", ".join(convert_namespaces)})...', file=sys.stderr)
         if args.keep_wasi_imports:
             print('  Preserving WASI imports (--keep-wasi-imports)...', file=sys.stderr)
-        else:
-            print('  Performing WASI stubbing...', file=sys.stderr)
-        if args.keep_wasi_imports and args.wasi_p1_bridge:
-            print('  Note: --wasi-p1-bridge ignored because --keep-wasi-imports is enabled.', file=sys.stderr)
-        head = perform_wasi_stubbing(
+            if args.wasi_p1_bridge:
+                print('  Note: --wasi-p1-bridge ignored because --keep-wasi-imports is enabled.', file=sys.stderr)
+        head = process_head(
             head,
+            convert_namespaces,
             stub_wasi=not args.keep_wasi_imports,
             use_wasi_p1_bridge=args.wasi_p1_bridge,
         )
 
-        final_wat = head + tail
+        # normalize_cabi_realloc_calls and fix_undefined_stubs must see the full
+        # module (their targets live past the import section), so the head/tail
+        # split ends here. Skip the full-size copy when there is no tail.
+        final_wat = (head + tail) if tail else head
         final_wat = normalize_cabi_realloc_calls(final_wat)
 
         print('  Fixing undefined_stub functions...', file=sys.stderr)
         final_wat = fix_undefined_stubs(final_wat)
+        _flush_log(args.verbose)
 
         if args.wat:
             print('  Writing modified WAT to output...', file=sys.stderr)
-            with open(args.output, 'w', encoding='utf-8') as f:
-                f.write(final_wat)
+            _write_output(args.output, final_wat)
             return
 
-        # Step 4: Compile WAT back to WASM
+        # Step 4: Compile WAT back to WASM. The WAT streams in over stdin and
+        # wasm-tools writes the module straight to the output file, so the
+        # final binary never round-trips through this process.
         print('  Compiling WAT to final WASM module...', file=sys.stderr)
-        final_wasm = run_command(['wasm-tools', 'parse'], input_data=final_wat.encode('utf-8'))
-
-        print('  Writing final module to output...', file=sys.stderr)
-        with open(args.output, 'wb') as f:
-            f.write(final_wasm)
+        run_command([_wasm_tools_exe(), 'parse', '-o', args.output], input_data=final_wat)
+
+        # Step 5 (optional): shrink the clipped module with wasm-opt if it is
+        # available; a smaller module loads and instantiates faster in hosts.
+        # Best-effort: a valid module is already at args.output, so a wasm-opt
+        # failure (e.g. a Binaryen build rejecting features NativeAOT emits)
+        # must not fail the publish.
+        if not args.no_opt:
+            wasm_opt = shutil.which('wasm-opt')
+            if wasm_opt:
+                print('  Optimizing with wasm-opt -Oz...', file=sys.stderr)
+                # Optimize into a sibling file so a failed run cannot clobber
+                # the module already written to args.output.
+                opt_path = args.output + '.opt'
+                try:
+                    run_command([
+                        wasm_opt, '-Oz', '--all-features',
+                        '--strip-debug', '--strip-producers',
+                        args.output, '-o', opt_path,
+                    ])
+                except RuntimeError as exc:
+                    print(f'  Warning: wasm-opt failed; keeping unoptimized module.\n{exc}', file=sys.stderr)
+                    if os.path.exists(opt_path):
+                        os.remove(opt_path)
+                else:
+                    os.replace(opt_path, args.output)
 
         print('  Done.', file=sys.stderr)
 